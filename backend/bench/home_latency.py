@@ -0,0 +1,63 @@
+"""Home screen latency: the four list/config calls the app used to make in a row
+versus a single GET /api/home.
+
+Run against a started server (any database with some data in it):
+
+    python bench/home_latency.py http://127.0.0.1:8000 50
+
+Each round is timed from the first request to the last response, one keep-alive
+connection per variant. The second half of /api/home rounds are cache hits
+unless something writes in between.
+"""
+import http.client
+import statistics
+import sys
+import time
+from urllib.parse import urlsplit
+
+SEQUENCE = [
+    "/api/config/",
+    "/api/memoryday/?limit=100",
+    "/api/lovelist/?limit=100",
+    "/api/album/?limit=20",
+]
+HOME = ["/api/home/"]
+
+def connect(base):
+    parts = urlsplit(base)
+    cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    return cls(parts.netloc, timeout=30)
+
+def run(conn, paths):
+    start = time.perf_counter()
+    for path in paths:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read()
+        if response.status != 200:
+            raise SystemExit(f"{path}: HTTP {response.status}")
+    return (time.perf_counter() - start) * 1000
+
+def report(name, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) >= 20 else samples[-1]
+    print(f"{name:<16} median {statistics.median(samples):8.2f} ms   p95 {p95:8.2f} ms")
+
+def main():
+    base = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:8000"
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    results = {}
+    for name, paths in (("four calls", SEQUENCE), ("/api/home", HOME)):
+        conn = connect(base)
+        run(conn, paths) # warm up connection and caches
+        results[name] = [run(conn, paths) for _ in range(rounds)]
+        conn.close()
+
+    for name, samples in results.items():
+        report(name, samples)
+    ratio = statistics.median(results["four calls"]) / statistics.median(results["/api/home"])
+    print(f"/api/home is {ratio:.1f}x faster (median)")
+
+if __name__ == "__main__":
+    main()
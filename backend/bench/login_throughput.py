@@ -0,0 +1,77 @@
+"""Login throughput under concurrency, and what it does to everyone else.
+
+Fires CONCURRENCY threads that log in repeatedly for DURATION seconds while one
+more thread polls GET /api/config/. With bcrypt on the event loop the config
+latency climbs to the length of the login queue; with the hashing pool it stays
+flat and excess logins get a quick 503 instead.
+
+    python bench/login_throughput.py http://127.0.0.1:8000 <username> <password> [concurrency] [seconds]
+"""
+import http.client
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+def connect(base):
+    parts = urlsplit(base)
+    cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    return cls(parts.netloc, timeout=60)
+
+def login_worker(base, body, deadline, results, lock):
+    conn = connect(base)
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        conn.request("POST", "/api/auth/login", body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        with lock:
+            results.setdefault(response.status, []).append((time.perf_counter() - start) * 1000)
+    conn.close()
+
+def probe_worker(base, deadline, samples):
+    conn = connect(base)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        conn.request("GET", "/api/config/")
+        conn.getresponse().read()
+        samples.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.05)
+    conn.close()
+
+def describe(samples):
+    samples = sorted(samples)
+    p95 = samples[max(int(len(samples) * 0.95) - 1, 0)]
+    return f"median {statistics.median(samples):8.2f} ms   p95 {p95:8.2f} ms"
+
+def main():
+    if len(sys.argv) < 4:
+        raise SystemExit(__doc__)
+    base, username, password = sys.argv[1:4]
+    concurrency = int(sys.argv[4]) if len(sys.argv) > 4 else 16
+    duration = float(sys.argv[5]) if len(sys.argv) > 5 else 10
+
+    body = urlencode({"username": username, "password": password})
+    deadline = time.perf_counter() + duration
+    results, probe, lock = {}, [], threading.Lock()
+
+    threads = [
+        threading.Thread(target=login_worker, args=(base, body, deadline, results, lock))
+        for _ in range(concurrency)
+    ]
+    threads.append(threading.Thread(target=probe_worker, args=(base, deadline, probe)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{concurrency} concurrent clients for {duration:.0f}s")
+    for status, samples in sorted(results.items()):
+        print(f"login {status}: {len(samples) / duration:7.1f} req/s   {describe(samples)}")
+    if probe:
+        print(f"GET /api/config/ meanwhile: {describe(probe)}")
+
+if __name__ == "__main__":
+    main()
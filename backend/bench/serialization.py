@@ -0,0 +1,79 @@
+"""Per-request serialization cost of an album page: the response_model path versus
+fastjson.json_response. No database or server needed; rows are built in memory.
+
+    python bench/serialization.py [albums] [photos_per_album] [comments_per_album]
+
+The response_model path is reproduced the way FastAPI runs it: validate the ORM
+objects into the schema (from_attributes), dump to JSON-able Python, json.dumps.
+Both outputs are decoded and compared (including key order) before timing.
+"""
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import TypeAdapter
+from models import Album, AlbumPhoto, AlbumComment
+from schemas import Album as AlbumSchema
+from fastjson import FastJSONResponse, project
+
+def build(albums, photos, comments):
+    rows = []
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    for i in range(albums):
+        album = Album(id=i + 1, description=f"Album {i}", date=date(2024, 1, 1) + timedelta(days=i), created_at=start + timedelta(hours=i))
+        album.photos = [
+            AlbumPhoto(
+                id=i * photos + j + 1, album_id=i + 1, url=f"/static/uploads/{i:06d}{j:02d}.jpg",
+                width=4032, height=3024, placeholder="data:image/webp;base64," + "A" * 120,
+                variants=[{"width": w, "height": w * 3 // 4, "url": f"/static/uploads/variants/{i}_{j}_{w}.webp"} for w in (256, 1024, 2048)],
+            )
+            for j in range(photos)
+        ]
+        album.comments = [
+            AlbumComment(id=i * comments + k + 1, album_id=i + 1, content=f"Comment {k} ❤️", username="boy", created_at=start + timedelta(minutes=k))
+            for k in range(comments)
+        ]
+        rows.append(album)
+    return rows
+
+def response_model_path(adapter, rows):
+    value = adapter.validate_python(rows, from_attributes=True)
+    content = adapter.dump_python(value, mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def fast_path(rows):
+    return FastJSONResponse([project(row, AlbumSchema) for row in rows]).body
+
+def measure(func, rounds):
+    func() # warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1000
+
+def main():
+    albums = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    photos = int(sys.argv[2]) if len(sys.argv) > 2 else 9
+    comments = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    rows = build(albums, photos, comments)
+    adapter = TypeAdapter(List[AlbumSchema])
+
+    standard, fast = response_model_path(adapter, rows), fast_path(rows)
+    # Re-dump the decoded values so key order is compared too
+    if json.dumps(json.loads(standard)) != json.dumps(json.loads(fast)):
+        raise SystemExit("Outputs differ")
+    print(f"{albums} albums x {photos} photos x {comments} comments, {len(fast) / 1024:.0f} KiB")
+
+    rounds = 50
+    slow_ms = measure(lambda: response_model_path(adapter, rows), rounds)
+    fast_ms = measure(lambda: fast_path(rows), rounds)
+    print(f"response_model   {slow_ms:8.2f} ms/request")
+    print(f"json_response    {fast_ms:8.2f} ms/request   ({slow_ms / fast_ms:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from changes import read_versions
+
+# Small in-process caches. Each uvicorn worker has its own copy, so entries are
+# either short-lived or tagged with a version read from the database (e.g. the
+# latest change_log id) that every worker sees.
+
+# name -> cache, for the hit/miss counters at /api/stats/caches
+CACHES = {}
+
+class TTLCache:
+    def __init__(self, name: str, maxsize: int = 128, ttl: float = 60.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict() # key -> (version, value, expires_at)
+        self._lock = threading.Lock()
+        CACHES[name] = self
+
+    def get(self, key, version=None):
+        # None on a miss; an entry only hits if its version matches
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] == version and entry[2] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, version=None):
+        with self._lock:
+            self._data[key] = (version, value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+class VersionedCache(TTLCache):
+    # Read-through cache for rarely-changing reads (the config row, counters).
+    # Entries are tagged with the change_log versions of the entities they are
+    # built from, so a write from any worker makes the next read reload - no
+    # explicit invalidation needed, even for a write committed out of id order
+    # (changes.entity_versions). Checking costs one statement, or nothing if
+    # conditional() already read the versions for this request.
+
+    def __init__(self, name: str, entities, maxsize: int = 16, ttl: float = 3600.0):
+        super().__init__(name, maxsize=maxsize, ttl=ttl)
+        self.entities = tuple(entities)
+
+    async def get_or_load(self, db, key, loader, versions=None):
+        # loader(db) must return something safe to share, e.g. a pydantic model
+        if versions is not None and all(entity in versions for entity in self.entities):
+            version = tuple(versions[entity] for entity in self.entities)
+        else:
+            versions = await read_versions(db, *self.entities)
+            version = tuple(versions[entity] for entity in self.entities)
+        value = self.get(key, version)
+        if value is None:
+            value = await loader(db)
+            self.set(key, value, version)
+        return value
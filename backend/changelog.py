@@ -0,0 +1,142 @@
+import time
+from datetime import timedelta
+from dataclasses import dataclass, field
+from typing import Dict, Iterable
+from sqlalchemy import select, delete, func, or_, text
+from config import get_settings
+from database import session_scope
+from models import ChangeLog
+import jobs
+
+settings = get_settings()
+
+# Reading change_log in id order (delta sync, the changelog event broker).
+#
+# Ids are handed out when a row is inserted, not when its transaction commits, so
+# a slow transaction can commit id 41 after id 42 is already visible. A reader
+# that only remembers "everything up to 42" never sees 41. A ChangeCursor also
+# remembers the ids it skipped over and asks for them again next time, until they
+# show up or CHANGE_LOG_SETTLE_SECONDS pass (then they were rolled back).
+# Only ids that can still be in flight count as skipped: among the newest
+# GAP_WINDOW, above the pruned part of the log, and above any row older than
+# CHANGE_LOG_SETTLE_SECONDS. At most MAX_MISSING are kept, newest first.
+
+GAP_WINDOW = 1000
+MAX_MISSING = 200
+
+@dataclass
+class ChangeCursor:
+    last_id: int = 0
+    missing: Dict[int, int] = field(default_factory=dict) # id -> unix time first missed
+
+    @classmethod
+    def parse(cls, token: str) -> "ChangeCursor":
+        # "<last id>" or "<last id>.<id>-<time>.<first id>_<last id>-<time>..."; raises ValueError
+        last_id, *gaps = token.split(".")
+        missing = {}
+        for gap in gaps:
+            ids, seen = gap.split("-")
+            first, _, last = ids.partition("_")
+            first, last = int(first), int(last or first)
+            if last < first or len(missing) + last - first >= MAX_MISSING:
+                raise ValueError("Bad gap list")
+            missing.update(dict.fromkeys(range(first, last + 1), int(seen)))
+        return cls(int(last_id), missing)
+
+    def __str__(self):
+        # Runs of consecutive ids missed at the same time collapse to first_last
+        runs = []
+        for i, t in sorted(self.missing.items()):
+            if runs and runs[-1][1] == i - 1 and runs[-1][2] == t:
+                runs[-1][1] = i
+            else:
+                runs.append([i, i, t])
+        gaps = [f"{first}-{t}" if first == last else f"{first}_{last}-{t}" for first, last, t in runs]
+        return ".".join([str(self.last_id)] + gaps)
+
+    def where(self):
+        # Rows after the cursor, plus the ones it is still waiting for
+        if self.missing:
+            return or_(ChangeLog.id > self.last_id, ChangeLog.id.in_(self.missing))
+        return ChangeLog.id > self.last_id
+
+    def unseen(self, seen, latest: int):
+        # Ids up to latest that a read with where() should have returned but didn't
+        return [i for i in range(max(self.last_id, latest - GAP_WINDOW) + 1, latest + 1) if i not in seen]
+
+    def advance(self, seen: Iterable[int], latest: int, now: float = None, floor: int = 0) -> "ChangeCursor":
+        # seen: every id read with where() up to latest, the newest id at read time.
+        # floor: ids at or below it can't be in flight any more (settled_floor)
+        now = int(now if now is not None else time.time())
+        seen = set(seen)
+        missing = {
+            i: t for i, t in self.missing.items()
+            if i > floor and i not in seen and now - t < settings.CHANGE_LOG_SETTLE_SECONDS
+        }
+        for i in self.unseen(seen, latest):
+            if i > floor:
+                missing[i] = now
+        if len(missing) > MAX_MISSING:
+            missing = dict(sorted(missing.items())[-MAX_MISSING:])
+        return ChangeCursor(max(self.last_id, latest), missing)
+
+async def settled_floor(db, latest: int) -> int:
+    # Highest id below which nothing can still commit: the pruned part of the
+    # log, and anything allocated before a row that is older than
+    # CHANGE_LOG_SETTLE_SECONDS (a transaction open that long counts as rolled back)
+    now = await db.scalar(select(func.now()))
+    cutoff = now - timedelta(seconds=settings.CHANGE_LOG_SETTLE_SECONDS)
+    settled = await db.scalar(
+        select(func.max(ChangeLog.id)).where(ChangeLog.id > latest - GAP_WINDOW, ChangeLog.created_at < cutoff)
+    )
+    oldest = await db.scalar(select(func.min(ChangeLog.id)).where(ChangeLog.id.notin_(_newest_per_entity())))
+    return max(settled or 0, oldest - 1 if oldest else 0)
+
+async def advance_cursor(db, cursor: ChangeCursor, seen: Iterable[int], latest: int) -> ChangeCursor:
+    # cursor.advance, looking up settled_floor only when there are new gaps
+    seen = set(seen)
+    floor = await settled_floor(db, latest) if cursor.unseen(seen, latest) else 0
+    return cursor.advance(seen, latest, floor=floor)
+
+async def current_cursor(db, latest: int = None) -> ChangeCursor:
+    # A cursor at the newest row, for readers that start from "now"
+    if latest is None:
+        latest = await db.scalar(select(func.max(ChangeLog.id))) or 0
+    recent = await db.scalars(select(ChangeLog.id).where(ChangeLog.id > latest - GAP_WINDOW))
+    return await advance_cursor(db, ChangeCursor(max(latest - GAP_WINDOW, 0)), recent, latest)
+
+def _newest_per_entity():
+    return select(func.max(ChangeLog.id)).group_by(ChangeLog.entity)
+
+async def pruned_before(db, latest: int) -> int:
+    # Deltas can start no earlier than this id: older rows may have been pruned.
+    # The per-entity rows prune_change_log keeps don't count
+    oldest = await db.scalar(select(func.min(ChangeLog.id)).where(ChangeLog.id.notin_(_newest_per_entity())))
+    return oldest - 1 if oldest else latest
+
+async def prune_change_log(db) -> int:
+    # Rows older than CHANGE_LOG_RETENTION_DAYS. The newest row of each entity
+    # stays: entity_versions reads it for ETags and cache keys. Sync tokens from
+    # before the cut get a full snapshot (routers/sync.py)
+    cutoff = func.timestampadd(text("DAY"), -settings.CHANGE_LOG_RETENTION_DAYS, func.now())
+    last = await db.scalar(select(func.max(ChangeLog.id)).where(ChangeLog.created_at < cutoff))
+    if not last:
+        return 0
+    keep = (await db.scalars(_newest_per_entity())).all()
+    first = await db.scalar(select(func.min(ChangeLog.id)))
+    removed = 0
+    # In id ranges, so each transaction stays small
+    for start in range(first - 1, last, 10000):
+        result = await db.execute(
+            delete(ChangeLog).where(
+                ChangeLog.id > start, ChangeLog.id <= min(start + 10000, last), ChangeLog.id.notin_(keep)
+            )
+        )
+        await db.commit()
+        removed += result.rowcount
+    return removed
+
+@jobs.register("prune_change_log", every=86400)
+async def prune_change_log_job(payload):
+    async with session_scope() as db:
+        await prune_change_log(db)
@@ -0,0 +1,95 @@
+from sqlalchemy import event, select, func
+from sqlalchemy.orm import Session
+from models import SiteConfig, MemoryDay, MemoryDayPhoto, Album, AlbumPhoto, AlbumComment, LoveList, ChangeLog
+import events
+
+# Change tracking for delta sync: every ORM flush that touches a synced entity
+# appends (entity, id, op) rows to change_log in the same transaction. Photos and
+# comments are reported as an upsert of their parent, which the client refetches
+# whole. Core UPDATE/DELETE statements bypass the flush; call log_changes for those.
+# Once the transaction commits, the same changes go out as live events (events.py).
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+ENTITIES = {
+    SiteConfig: "config",
+    MemoryDay: "memoryday",
+    Album: "album",
+    LoveList: "lovelist",
+}
+
+# child model -> (parent entity, foreign key attribute)
+CHILDREN = {
+    MemoryDayPhoto: ("memoryday", "memory_day_id"),
+    AlbumPhoto: ("album", "album_id"),
+    AlbumComment: ("album", "album_id"),
+}
+
+def _collect(session):
+    changes = {}
+    for obj in session.deleted:
+        entity = ENTITIES.get(type(obj))
+        if entity:
+            changes[(entity, obj.id)] = DELETE
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        entity = ENTITIES.get(type(obj))
+        if entity and obj not in session.deleted:
+            changes.setdefault((entity, obj.id), UPSERT)
+        elif type(obj) in CHILDREN:
+            parent_entity, fk = CHILDREN[type(obj)]
+            parent_id = getattr(obj, fk)
+            if parent_id is not None:
+                # A parent deleted in the same flush keeps its delete
+                changes.setdefault((parent_entity, parent_id), UPSERT)
+    return changes
+
+PENDING_EVENTS = "pending_events" # session.info key
+
+def log_changes(session, changes):
+    if changes:
+        session.connection().execute(
+            ChangeLog.__table__.insert(),
+            [{"entity": entity, "entity_id": entity_id, "op": op} for (entity, entity_id), op in changes.items()],
+        )
+        session.info.setdefault(PENDING_EVENTS, {}).update(changes)
+
+@event.listens_for(Session, "after_flush")
+def record_changes(session, flush_context):
+    # new/dirty/deleted still show the pre-flush state here, and new rows have ids
+    log_changes(session, _collect(session))
+
+@event.listens_for(Session, "after_commit")
+def publish_changes(session):
+    pending = session.info.pop(PENDING_EVENTS, None)
+    if pending:
+        events.publish([
+            {"entity": entity, "id": entity_id, "op": op} for (entity, entity_id), op in pending.items()
+        ])
+
+@event.listens_for(Session, "after_rollback")
+def discard_changes(session):
+    session.info.pop(PENDING_EVENTS, None)
+
+# Rows counted below an entity's newest id (see entity_versions)
+VERSION_WINDOW = 1000
+
+def entity_versions(*entities):
+    # Per entity: the newest change_log id, and how many of its rows lie within
+    # VERSION_WINDOW ids below that. Ids are allocated before commit, so a write
+    # can become visible after a higher id (see changelog.py): the max stays put
+    # but the count moves, so the pair changes on every commit. Two index range
+    # lookups each on ix_change_log_entity_id. Read them with read_versions
+    columns = []
+    for entity in entities:
+        newest = select(func.max(ChangeLog.id)).where(ChangeLog.entity == entity).scalar_subquery()
+        recent = select(func.count()).where(ChangeLog.entity == entity, ChangeLog.id > newest - VERSION_WINDOW)
+        columns += [newest, recent.scalar_subquery()]
+    return select(*columns)
+
+async def read_versions(db, *entities) -> dict:
+    # {entity: "<newest id>.<recent count>"}, the version stamp every worker agrees on
+    row = (await db.execute(entity_versions(*entities))).one()
+    return {entity: f"{row[2 * i] or 0}.{row[2 * i + 1]}" for i, entity in enumerate(entities)}
@@ -0,0 +1,48 @@
+import hashlib
+from datetime import date
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db
+from changes import read_versions
+
+# Conditional GET for the read endpoints. Every write to a synced entity appends to
+# change_log (see changes.py), so its newest rows there make a version for that
+# table that moves on every commit (changes.entity_versions). The ETag hashes those
+# versions with the request path and query; a matching If-None-Match gets a 304
+# before the endpoint loads or serializes rows.
+#
+#     @router.get("/", dependencies=[Depends(conditional("album"))])
+#
+# The dependency shares the request's session (FastAPI caches get_db per request)
+# and leaves the versions in request.state.versions for VersionedCache.
+
+# Part of every ETag; bump when the body format changes so clients drop bodies
+# cached under the old one (2: media URLs moved to /media/)
+REPRESENTATION = "2"
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates
+
+def conditional(*entities: str, daily: bool = False):
+    # daily: the body also depends on today's date (e.g. days until an anniversary)
+    async def check(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+        versions = await read_versions(db, *entities)
+        request.state.versions = versions
+        parts = [REPRESENTATION, request.url.path, request.url.query]
+        parts += [f"{entity}:{version}" for entity, version in versions.items()]
+        if daily:
+            parts.append(date.today().isoformat())
+        etag = '"' + hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:32] + '"'
+
+        # no-cache: clients may store the body but must revalidate each time
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+    return check
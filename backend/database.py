@@ -1,10 +1,14 @@
+from contextlib import asynccontextmanager
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
 from config import get_settings
 
 settings = get_settings()
 
+# Sync engine: table creation, migrations, scripts and the DB_ASYNC=false request path
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,
@@ -13,11 +17,76 @@ engine = create_engine(
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine (aiomysql) used by the request handlers when DB_ASYNC is on
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL or settings.DATABASE_URL.replace("+pymysql", "+aiomysql", 1),
+    pool_pre_ping=True,
+    pool_recycle=3600
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+def _threaded(name):
+    async def method(self, *args, **kwargs):
+        return await run_in_threadpool(getattr(self.sync_session, name), *args, **kwargs)
+    method.__name__ = name
+    return method
+
+class ThreadedSession:
+    # Same awaitable API as AsyncSession, backed by a sync pymysql Session whose
+    # calls run in the threadpool. Lets DB_ASYNC=false be benchmarked against the
+    # aiomysql path without a second copy of every router.
+
+    def __init__(self, sync_session):
+        self.sync_session = sync_session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    def expunge(self, instance):
+        self.sync_session.expunge(instance)
+
+    async def execute(self, statement, params=None, execution_options=None, **kwargs):
+        # Buffer rows (and run eager loaders) in the worker thread, like AsyncSession does
+        options = dict(execution_options or {}, prebuffer_rows=True)
+        return await run_in_threadpool(
+            self.sync_session.execute, statement, params, execution_options=options, **kwargs
+        )
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return (await self.execute(statement, params, **kwargs)).scalars()
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return (await self.execute(statement, params, **kwargs)).scalar()
+
+    get = _threaded("get")
+    flush = _threaded("flush")
+    commit = _threaded("commit")
+    rollback = _threaded("rollback")
+    refresh = _threaded("refresh")
+    delete = _threaded("delete")
+    close = _threaded("close")
+
+ThreadedSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+@asynccontextmanager
+async def session_scope():
+    # One session outside the request dependency, e.g. for queries run concurrently
+    if settings.DB_ASYNC:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = ThreadedSession(ThreadedSessionLocal())
+        try:
+            yield db
+        finally:
+            await db.close()
+
+async def get_db():
+    async with session_scope() as db:
         yield db
-    finally:
-        db.close()
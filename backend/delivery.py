@@ -0,0 +1,139 @@
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from urllib.parse import quote
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from config import get_settings
+from conditional import etag_matches
+from uploads import EXTENSIONS
+
+settings = get_settings()
+
+# File delivery for /media with HTTP Range support, so video players can seek
+# and resume without downloading from the start, plus validators (ETag,
+# Last-Modified) and caching headers. Only single ranges are served as 206;
+# anything else (multiple ranges, other units) gets the whole file, as RFC 9110
+# allows.
+#
+# With MEDIA_ACCEL_REDIRECT on, send_file only answers with an X-Accel-Redirect
+# header and nginx streams the file from an internal location (sendfile, its own
+# Range handling); Python never touches the bytes. Without a proxy the same call
+# falls back to file_response.
+
+STREAM_CHUNK_SIZE = 256 * 1024
+# Uploads are content addressed: a URL never changes content
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Same, for responses that needed a login: browsers only, no shared caches
+PRIVATE_IMMUTABLE = "private, max-age=31536000, immutable"
+
+# directory -> name of its internal nginx location under MEDIA_ACCEL_PREFIX
+ACCEL_ROOTS = [
+    (settings.UPLOAD_DIR, "uploads"),
+    ("static/img", "img"),
+    (settings.MEDIA_CACHE_DIR, "cache"),
+]
+
+CONTENT_TYPES = {extension: content_type for content_type, extension in EXTENSIONS.items()}
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def content_type_for(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    return CONTENT_TYPES.get(extension) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def parse_range(header, size: int):
+    # (start, end) inclusive, or None for the whole file
+    match = RANGE.match(header.strip()) if header else None
+    if not match or match.groups() == ("", ""):
+        return None
+    if size == 0:
+        # No byte of an empty file can be selected
+        raise RangeNotSatisfiable()
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0:
+            raise RangeNotSatisfiable()
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None # invalid, ignore the header
+    if start >= size:
+        raise RangeNotSatisfiable()
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+async def iter_file(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        await run_in_threadpool(f.seek, start)
+        remaining = length
+        while remaining > 0:
+            data = await run_in_threadpool(f.read, min(STREAM_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+def file_etag(path: str, st) -> str:
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+async def file_response(request: Request, path: str, cache_control: str, etag: str = None, content_type: str = None):
+    st = await run_in_threadpool(os.stat, path)
+    size = st.st_size
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control,
+        "ETag": etag or file_etag(path, st),
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+    }
+    content_type = content_type or content_type_for(path)
+
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    # If-Range: only honour the range if the client's copy is still current
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range.strip() == headers["ETag"]:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    status_code = 200
+    start, length = 0, size
+    if byte_range is not None:
+        start, end = byte_range
+        length = end - start + 1
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(length)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=content_type)
+    return StreamingResponse(iter_file(path, start, length), status_code=status_code, headers=headers, media_type=content_type)
+
+def accel_uri(path: str):
+    real = os.path.realpath(path)
+    for directory, name in ACCEL_ROOTS:
+        root = os.path.realpath(directory)
+        if os.path.commonpath([root, real]) == root:
+            relative = os.path.relpath(real, root).replace(os.sep, "/")
+            return f"{settings.MEDIA_ACCEL_PREFIX}/{name}/{quote(relative)}"
+    return None
+
+async def send_file(request: Request, path: str, cache_control: str, etag: str = None, content_type: str = None):
+    if settings.MEDIA_ACCEL_REDIRECT:
+        uri = accel_uri(path)
+        if uri is not None:
+            # nginx keeps Content-Type and Cache-Control from this response
+            return Response(
+                headers={"X-Accel-Redirect": uri, "Cache-Control": cache_control},
+                media_type=content_type or content_type_for(path),
+            )
+    return await file_response(request, path, cache_control, etag=etag, content_type=content_type)
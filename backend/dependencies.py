@@ -1,17 +1,62 @@
-from fastapi import Depends, HTTPException, status
+import time
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from config import get_settings
 from database import get_db
 from models import User
 from schemas import TokenData
+from cache import TTLCache
+from typing import Optional
 
 settings = get_settings()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+oauth2_optional = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# username -> CachedUser (a detached User), stored under the user's token_version.
+# A token whose "ver" claim doesn't match misses and is checked against the
+# database again. Hits cost nothing; once an entry's token_version is more than
+# USER_REVALIDATE_SECONDS old it is re-read (a primary key lookup), so a password
+# change on another worker revokes old tokens there within that window. This
+# worker drops its copy straight away (invalidate_user).
+# Treat the cached user as read-only; load it into the session before changing it.
+user_cache = TTLCache("users", maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_SECONDS)
+
+class CachedUser:
+    __slots__ = ("user", "checked_at")
+
+    def __init__(self, user):
+        self.user = user
+        self.checked_at = time.monotonic()
+
+# Claim of the short-lived tokens issued by /api/auth/media-token
+MEDIA_SCOPE = "media"
+
+def invalidate_user(username: str):
+    # Frees this worker's copy; the others notice the new version on their next hit
+    user_cache.invalidate(username)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    return await user_from_token(token, db)
+
+async def get_media_user(
+    header_token: Optional[str] = Depends(oauth2_optional),
+    token: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    # <img>/<video> tags can't send an Authorization header, so they pass a
+    # short-lived media token (GET /api/auth/media-token) as ?token= instead.
+    # The login token itself is only accepted in the header, never in a URL.
+    if header_token:
+        return await user_from_token(header_token, db)
+    return await user_from_token(token or "", db, scope=MEDIA_SCOPE)
+
+async def user_from_token(token: str, db, scope: Optional[str] = None):
+    # scope: None for login tokens, MEDIA_SCOPE for media tokens; neither is
+    # accepted in place of the other
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -20,13 +65,31 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("scope") != scope:
             raise credentials_exception
         token_data = TokenData(username=username)
-    except JWTError:
+        version = int(payload.get("ver", 0)) # tokens issued before versioning count as 0
+    except (JWTError, TypeError, ValueError):
+        raise credentials_exception
+
+    cached = user_cache.get(token_data.username, version)
+    if cached is not None:
+        if time.monotonic() - cached.checked_at < settings.USER_REVALIDATE_SECONDS:
+            return cached.user
+        current = await db.scalar(select(User.token_version).where(User.id == cached.user.id))
+        if current == version:
+            cached.checked_at = time.monotonic()
+            return cached.user
+        # Revoked (or the user is gone) since this entry was cached
+        user_cache.invalidate(token_data.username)
         raise credentials_exception
-    
-    user = db.query(User).filter(User.username == token_data.username).first()
+
+    user = await db.scalar(select(User).where(User.username == token_data.username))
     if user is None:
         raise credentials_exception
+    # Detach so a rollback in this request can't expire the shared copy
+    db.expunge(user)
+    user_cache.set(user.username, CachedUser(user), user.token_version)
+    if user.token_version != version:
+        raise credentials_exception
     return user
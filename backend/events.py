@@ -0,0 +1,136 @@
+import asyncio
+from sqlalchemy import select
+from config import get_settings
+from database import session_scope
+from models import ChangeLog
+from changelog import ChangeCursor, advance_cursor, current_cursor
+
+settings = get_settings()
+
+# Live change events for /api/events. Every committed write to album, memoryday,
+# lovelist or config becomes a compact event {"entity", "id", "op"} that the hub
+# fans out to the connected clients, who then pull the rows through /api/sync.
+#
+# How events reach the hub is up to the broker (EVENTS_BROKER):
+#   memory    - one process: the commit hook in changes.py hands events straight
+#               to this process's hub
+#   changelog - several uvicorn workers: each worker tails change_log, which
+#               every write already appends to, so a write in any worker
+#               reaches clients connected to any other one
+
+class Hub:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.loop = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def broadcast(self, events):
+        # Event loop thread only
+        for queue in list(self.subscribers):
+            try:
+                for event in events:
+                    queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Client fell behind: drop its backlog and tell it to resync instead
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"op": "resync"})
+
+class MemoryBroker:
+    def __init__(self, hub: Hub):
+        self.hub = hub
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish(self, events):
+        # Any thread (ThreadedSession and background jobs commit off the loop)
+        self.hub.loop.call_soon_threadsafe(self.hub.broadcast, events)
+
+class ChangeLogBroker:
+    def __init__(self, hub: Hub, interval: float, batch: int = 500):
+        self.hub = hub
+        self.interval = interval
+        self.batch = batch
+        # Ids committing out of order are caught up on later (changelog.py)
+        self.cursor = ChangeCursor()
+        self._task = None
+
+    async def start(self):
+        async with session_scope() as db:
+            self.cursor = await current_cursor(db)
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def publish(self, events):
+        # Nothing to do: the same commit wrote them to change_log
+        pass
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll_once()
+            except Exception as e:
+                print(f"Error polling change log: {e}")
+
+    async def poll_once(self):
+        async with session_scope() as db:
+            rows = (await db.execute(
+                select(ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op)
+                .where(self.cursor.where())
+                .order_by(ChangeLog.id)
+                .limit(self.batch)
+            )).all()
+            # Everything up to the last row returned has been read
+            latest = rows[-1].id if rows else self.cursor.last_id
+            self.cursor = await advance_cursor(db, self.cursor, [row.id for row in rows], latest)
+        if rows:
+            self.hub.broadcast([{"entity": row.entity, "id": row.entity_id, "op": row.op} for row in rows])
+
+BROKERS = {
+    "memory": lambda hub: MemoryBroker(hub),
+    "changelog": lambda hub: ChangeLogBroker(hub, settings.EVENTS_POLL_SECONDS),
+}
+
+hub = Hub(settings.EVENTS_QUEUE_SIZE)
+broker = None
+
+async def current_token() -> str:
+    # Sync token as of now, for the ready event
+    async with session_scope() as db:
+        return str(await current_cursor(db))
+
+async def start():
+    global broker
+    if settings.EVENTS_BROKER not in BROKERS:
+        raise ValueError(f"Unknown EVENTS_BROKER {settings.EVENTS_BROKER!r}")
+    hub.loop = asyncio.get_running_loop()
+    broker = BROKERS[settings.EVENTS_BROKER](hub)
+    await broker.start()
+
+async def stop():
+    global broker
+    if broker is not None:
+        await broker.stop()
+        broker = None
+
+def publish(events):
+    # Called by changes.py after a commit; a no-op outside the app (scripts)
+    if broker is not None and events:
+        broker.publish(events)
@@ -0,0 +1,97 @@
+import json
+from functools import lru_cache
+from typing import Annotated, Union, get_args, get_origin
+from fastapi import Response
+from pydantic import BaseModel, PlainSerializer
+from config import get_settings
+
+try:
+    import orjson
+except ImportError: # plain json below, same output
+    orjson = None
+
+settings = get_settings()
+
+# Fast path for big read-only responses. Returning ORM rows through response_model
+# validates every album, photo and comment into a pydantic model, dumps it back to
+# dicts and then encodes with json - all in Python. Here rows are projected straight
+# into dicts following the schema's fields (same names, same order, same nesting)
+# and encoded once with orjson. Nothing is validated, so only use it for rows that
+# came from the database. FAST_JSON=false returns to the standard path.
+#
+#     return json_response(items, List[AlbumSchema], response)
+
+def _serializer(metadata):
+    # JSON serializer of an Annotated field (e.g. schemas.MediaURL), else None
+    for item in metadata:
+        if isinstance(item, PlainSerializer) and item.when_used in ("always", "json"):
+            return item.func
+    return None
+
+@lru_cache(maxsize=None)
+def _fields(schema):
+    # [(name, nested schema or None, default, serializer or None)] in output order
+    fields = []
+    for name, field in schema.model_fields.items():
+        annotation = field.annotation
+        serialize = _serializer(field.metadata)
+        # Optional[List[X]] -> X
+        while get_origin(annotation) in (Union, list):
+            annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+        if get_origin(annotation) is Annotated:
+            serialize = serialize or _serializer(annotation.__metadata__)
+            annotation = get_args(annotation)[0]
+        nested = annotation if isinstance(annotation, type) and issubclass(annotation, BaseModel) else None
+        default = None if field.is_required() else field.get_default(call_default_factory=True)
+        fields.append((name, nested, default, serialize))
+    return tuple(fields)
+
+def project(obj, schema):
+    # ORM object, pydantic model or dict (JSON columns) -> dict shaped like schema
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        get = obj.get
+    else:
+        get = lambda name, default: getattr(obj, name, default)
+    out = {}
+    for name, nested, default, serialize in _fields(schema):
+        value = get(name, default)
+        if nested is not None and value is not None:
+            if isinstance(value, (list, tuple)):
+                value = [project(item, nested) for item in value]
+            else:
+                value = project(value, nested)
+        elif serialize is not None and value is not None:
+            if isinstance(value, (list, tuple)):
+                value = [serialize(item) for item in value]
+            else:
+                value = serialize(value)
+        out[name] = value
+    return out
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        # OPT_UTC_Z: aware UTC datetimes end in "Z", as pydantic writes them
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=lambda o: o.isoformat()).encode("utf-8")
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+def json_response(content, schema, response: Response = None):
+    # schema: a response schema or List[schema]. Headers set on the endpoint's
+    # injected Response (cursor, ETag) are copied over, as FastAPI would do.
+    if not settings.FAST_JSON:
+        return content
+    if get_origin(schema) is list:
+        body = [project(item, get_args(schema)[0]) for item in content]
+    else:
+        body = project(content, schema)
+    fast = FastJSONResponse(body)
+    if response is not None:
+        fast.headers.raw.extend(response.headers.raw)
+    return fast
@@ -0,0 +1,273 @@
+import os
+from PIL import Image, ImageOps
+import base64
+import io
+from sqlalchemy import select, update
+from starlette.concurrency import run_in_threadpool
+from config import get_settings
+from database import SessionLocal
+from models import AlbumPhoto, MemoryDayPhoto, LoveList
+from changes import ENTITIES, CHILDREN, UPSERT, log_changes
+from uploads import UPLOAD_URL_PREFIX, upload_key
+from videos import is_video, poster_path, probe_duration, extract_poster
+from storage import storage
+import jobs
+
+settings = get_settings()
+
+# Downscaled copies of uploaded photos so list views don't pull full-resolution
+# originals over mobile data. Variants sit next to the original as
+# <stem>_<size>.<ext>; the stem is the content hash, so rows sharing a file share
+# its variants too. Analysis works on a local copy (storage.fetch) and the files
+# it writes next to that copy are then put into storage under the same names.
+
+VARIANT_SIZES = (256, 1024, 2048)
+# Inline LQIP: a tiny WebP shown blurred while the real image loads
+PLACEHOLDER_SIZE = 16
+# fmt -> (Pillow format, extension, content type)
+OUTPUT_FORMATS = {
+    "webp": ("WEBP", ".webp", "image/webp"),
+    "jpeg": ("JPEG", ".jpg", "image/jpeg"),
+    "png": ("PNG", ".png", "image/png"),
+}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".heic"}
+
+def is_image(path):
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+def variant_keys(key):
+    # Every derived key the original may have (any variant format, the poster frame);
+    # deleting one that was never written is a no-op
+    stem = os.path.splitext(key)[0]
+    keys = [f"{stem}_{size}{extension}" for size in VARIANT_SIZES for _, extension, _ in OUTPUT_FORMATS.values()]
+    keys.append(poster_path(key))
+    return keys
+
+def derived_keys(result):
+    # Files an analysis wrote next to its source
+    urls = [variant["url"] for variant in result.get("variants", [])]
+    if result.get("poster"):
+        urls.append(result["poster"])
+    return [upload_key(url) for url in urls]
+
+def _save(image, path, pil_format, quality):
+    # Nothing from the original's info (EXIF, GPS, ...) is passed on
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if pil_format == "JPEG":
+        image.convert("RGB").save(tmp_path, pil_format, quality=quality, optimize=True, progressive=True)
+    elif pil_format == "WEBP":
+        image.save(tmp_path, pil_format, quality=quality, method=4)
+    else:
+        image.save(tmp_path, pil_format, optimize=True)
+    os.replace(tmp_path, path)
+
+def _open_oriented(original):
+    image = ImageOps.exif_transpose(original)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    return image
+
+def _variants(image, path):
+    pil_format, extension, _ = OUTPUT_FORMATS[settings.IMAGE_VARIANT_FORMAT]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    variants = []
+    longest = max(image.size)
+    for size in VARIANT_SIZES:
+        # Never upscale; the smallest variant is always produced (re-encoded, metadata stripped)
+        if variants and size >= longest:
+            break
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        filename = f"{stem}_{size}{extension}"
+        variant_path = os.path.join(os.path.dirname(path), filename)
+        if not os.path.exists(variant_path):
+            _save(resized, variant_path, pil_format, 80 if pil_format == "WEBP" else 85)
+        variants.append({
+            "width": resized.width,
+            "height": resized.height,
+            "url": f"{UPLOAD_URL_PREFIX}{filename}",
+        })
+    return variants
+
+def _placeholder(image):
+    tiny = image.copy()
+    tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.BILINEAR)
+    buffer = io.BytesIO()
+    tiny.save(buffer, "WEBP", quality=40)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+def analyze_image(path):
+    # Blocking and CPU heavy: never call on the event loop.
+    # Intrinsic size is after EXIF rotation, i.e. what the client displays.
+    with Image.open(path) as original:
+        image = _open_oriented(original)
+        return {
+            "width": image.width,
+            "height": image.height,
+            "placeholder": _placeholder(image),
+            "variants": _variants(image, path),
+        }
+
+def analyze_video(path):
+    # Blocking: runs ffprobe/ffmpeg. Size and placeholder come from the poster
+    # frame (ffmpeg applies the rotation), i.e. what the client displays
+    duration = probe_duration(path)
+    if duration is None:
+        return None
+    result = {"duration": duration}
+    poster = extract_poster(path, min(settings.VIDEO_POSTER_SECONDS, duration / 2))
+    if poster:
+        result["poster"] = f"{UPLOAD_URL_PREFIX}{os.path.basename(poster)}"
+        with Image.open(poster) as original:
+            image = _open_oriented(original)
+            result.update(width=image.width, height=image.height, placeholder=_placeholder(image))
+    return result
+
+def resize_image(source_path, dest_path, width, height, fmt, quality):
+    # Worker for the /media resize endpoint (runs in a process pool).
+    # Fits the image inside width x height keeping aspect ratio, never upscales.
+    pil_format = OUTPUT_FORMATS[fmt][0]
+    with Image.open(source_path) as original:
+        image = _open_oriented(original)
+        if width or height:
+            image.thumbnail((width or image.width, height or image.height), Image.LANCZOS)
+        _save(image, dest_path, pil_format, quality)
+    return os.path.getsize(dest_path)
+
+# Rows that carry derived image data: model -> (url column, result key -> column)
+IMAGE_TARGETS = {
+    AlbumPhoto: ("url", {"width": "width", "height": "height", "placeholder": "placeholder", "variants": "variants", "poster": "poster", "duration": "duration"}),
+    MemoryDayPhoto: ("url", {"width": "width", "height": "height", "placeholder": "placeholder", "variants": "variants", "poster": "poster", "duration": "duration"}),
+    LoveList: ("image_url", {"width": "image_width", "height": "image_height", "placeholder": "image_placeholder"}),
+}
+
+def media_source(url):
+    # Storage key of an uploaded image or video that can be analyzed, else None
+    key = upload_key(url)
+    if key is None or not (is_image(key) or is_video(key)) or not storage.exists(key):
+        return None
+    return key
+
+def store_derived(path, result):
+    # Blocking. Put the variants/poster written next to the local copy into storage
+    directory = os.path.dirname(path)
+    for key in derived_keys(result):
+        storage.put_file(os.path.join(directory, key), key)
+
+def process_image_url(db, url):
+    # Analyze one file and record the result on every row (any model) that uses it
+    key = media_source(url)
+    if key is None:
+        return False
+    path = storage.fetch(key)
+    try:
+        result = analyze_image(path) if is_image(path) else analyze_video(path)
+        if result is not None:
+            store_derived(path, result)
+    except Exception as e:
+        print(f"Error processing image {url}: {e}")
+        return False
+    finally:
+        storage.release(path)
+    if result is None:
+        return False
+    save_image_result(db, url, result)
+    return True
+
+def save_image_result(db, url, result):
+    changed = {}
+    for model, (url_attr, fields) in IMAGE_TARGETS.items():
+        values = {column: result[key] for key, column in fields.items() if key in result}
+        if not values:
+            continue
+        db.execute(update(model).where(getattr(model, url_attr) == url).values(**values))
+
+        # Core updates skip the flush hook, so report the touched entities for delta sync
+        if model in CHILDREN:
+            entity, fk = CHILDREN[model]
+            id_column = getattr(model, fk)
+        else:
+            entity, id_column = ENTITIES[model], model.id
+        for entity_id in db.scalars(select(id_column).where(getattr(model, url_attr) == url).distinct()):
+            changed[(entity, entity_id)] = UPSERT
+    log_changes(db, changed)
+    db.commit()
+
+MODELS_BY_NAME = {model.__name__: model for model in IMAGE_TARGETS}
+
+def pending_image_url(model, item_id):
+    # URL of the row's image if it still needs processing
+    url_attr, fields = IMAGE_TARGETS[model]
+    db = SessionLocal()
+    try:
+        item = db.get(model, item_id)
+        if item is None or getattr(item, fields["placeholder"]) is not None:
+            return None
+        return getattr(item, url_attr)
+    finally:
+        db.close()
+
+def store_image_result(url, result):
+    db = SessionLocal()
+    try:
+        save_image_result(db, url, result)
+    finally:
+        db.close()
+
+@jobs.register("process_photo", concurrency=settings.JOBS_IMAGE_CONCURRENCY, max_attempts=3)
+async def process_photo_job(payload):
+    # Post-upload step for an AlbumPhoto, MemoryDayPhoto or LoveList row:
+    # Pillow runs in the job process pool, ffmpeg and the database work in the threadpool
+    model = MODELS_BY_NAME[payload["model"]]
+    url = await run_in_threadpool(pending_image_url, model, payload["id"])
+    key = await run_in_threadpool(media_source, url) if url else None
+    if key is None:
+        return
+    path = await run_in_threadpool(storage.fetch, key)
+    try:
+        if is_image(path):
+            result = await jobs.run_cpu(analyze_image, path)
+        else:
+            result = await run_in_threadpool(analyze_video, path)
+        if result is not None:
+            await run_in_threadpool(store_derived, path, result)
+    finally:
+        await run_in_threadpool(storage.release, path)
+    if result is not None:
+        await run_in_threadpool(store_image_result, url, result)
+
+async def schedule_processing(db, model, item_id):
+    # Commits (see jobs.enqueue)
+    await jobs.enqueue(db, "process_photo", {"model": model.__name__, "id": item_id})
+
+def backfill(batch_size=200):
+    # Batch job for files uploaded before placeholders/variants existed
+    db = SessionLocal()
+    done = set()
+    processed = 0
+    try:
+        for model, (url_attr, fields) in IMAGE_TARGETS.items():
+            url_column = getattr(model, url_attr)
+            last_id = 0
+            while True:
+                rows = db.execute(
+                    select(model.id, url_column)
+                    .where(model.id > last_id, url_column.isnot(None), getattr(model, fields["placeholder"]).is_(None))
+                    .order_by(model.id)
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                for _, url in rows:
+                    if url not in done:
+                        done.add(url)
+                        if process_image_url(db, url):
+                            processed += 1
+    finally:
+        db.close()
+    return processed
+
+if __name__ == "__main__":
+    # Manual run: python images.py
+    print(f"Processed {backfill()} images")
@@ -0,0 +1,210 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import select, update, delete, and_, or_, func, text
+from config import get_settings
+from database import session_scope
+from models import Job
+
+settings = get_settings()
+
+# Background jobs stored in the jobs table, so work queued by a request survives a
+# restart. Every uvicorn worker runs a Runner that claims due jobs with
+# SELECT ... FOR UPDATE SKIP LOCKED, runs at most `concurrency` of each type at
+# once, retries failures with exponential backoff and, on shutdown, lets running
+# jobs finish for up to JOBS_DRAIN_SECONDS. A worker that dies mid-job leaves a
+# lease (locked_until) behind; once it expires another worker retries the job.
+#
+# Handlers are async functions of the payload dict, registered by name:
+#
+#     @jobs.register("process_photo", concurrency=2)
+#     async def process_photo_job(payload): ...
+#
+#     await jobs.enqueue(db, "process_photo", {"model": "AlbumPhoto", "id": 7})
+#
+# Blocking I/O goes through run_in_threadpool, CPU work through jobs.run_cpu
+# (a process pool). Handlers must be idempotent: a job can run more than once.
+
+PENDING = "pending"
+RUNNING = "running"
+FAILED = "failed"
+
+@dataclass
+class JobType:
+    name: str
+    handler: Callable[[dict], Awaitable[None]]
+    concurrency: int = 1 # per worker process
+    max_attempts: int = 5
+    every: Optional[float] = None # seconds; queued automatically when set
+
+JOB_TYPES = {}
+
+def register(name: str, concurrency: int = 1, max_attempts: int = 5, every: Optional[float] = None):
+    def decorator(handler):
+        JOB_TYPES[name] = JobType(name, handler, concurrency, max_attempts, every)
+        return handler
+    return decorator
+
+def _seconds_from_now(seconds):
+    return func.timestampadd(text("SECOND"), int(seconds), func.now())
+
+async def enqueue(db, name: str, payload: Optional[dict] = None, delay: float = 0):
+    # Commits. Call after the rows the job refers to are committed
+    job = Job(type=name, payload=payload or {}, status=PENDING, max_attempts=JOB_TYPES[name].max_attempts)
+    if delay:
+        job.run_at = _seconds_from_now(delay)
+    db.add(job)
+    await db.commit()
+    runner.notify()
+
+def backoff(attempts: int) -> float:
+    # 30 s, 60 s, 120 s ... capped, with jitter so failures don't retry in lockstep
+    delay = min(settings.JOBS_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.JOBS_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(1.0, 1.25)
+
+_cpu_executor = None
+
+async def run_cpu(func, *args):
+    # func and args must be picklable (module-level function, plain values)
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = ProcessPoolExecutor(max_workers=settings.JOBS_CPU_WORKERS)
+    return await asyncio.get_running_loop().run_in_executor(_cpu_executor, func, *args)
+
+async def claim(name: str, limit: int):
+    async with session_scope() as db:
+        due = or_(
+            and_(Job.status == PENDING, Job.run_at <= func.now()),
+            and_(Job.status == RUNNING, Job.locked_until < func.now()), # lease expired
+        )
+        claimed = (await db.scalars(
+            select(Job).where(Job.type == name, due)
+            .order_by(Job.run_at, Job.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )).all()
+        for job in claimed:
+            job.status = RUNNING
+            job.attempts = (job.attempts or 0) + 1
+            job.locked_until = _seconds_from_now(settings.JOBS_LEASE_SECONDS)
+        await db.commit()
+        return [(job.id, job.payload or {}, job.attempts, job.max_attempts) for job in claimed]
+
+async def complete(job_id: int):
+    async with session_scope() as db:
+        await db.execute(delete(Job).where(Job.id == job_id))
+        await db.commit()
+
+async def fail(job_id: int, attempts: int, max_attempts: int, error: str):
+    values = {"last_error": error[:2000], "locked_until": None}
+    if attempts >= max_attempts:
+        values["status"] = FAILED
+    else:
+        values.update(status=PENDING, run_at=_seconds_from_now(backoff(attempts)))
+    async with session_scope() as db:
+        await db.execute(update(Job).where(Job.id == job_id).values(**values))
+        await db.commit()
+
+async def ensure_queued(name: str):
+    # Periodic jobs: queue one unless one is already waiting or running
+    async with session_scope() as db:
+        exists = await db.scalar(
+            select(Job.id).where(Job.type == name, Job.status.in_([PENDING, RUNNING])).limit(1)
+        )
+        if exists is None:
+            db.add(Job(type=name, payload={}, status=PENDING, max_attempts=JOB_TYPES[name].max_attempts))
+            await db.commit()
+
+class Runner:
+    def __init__(self):
+        self.loop = None
+        self.active = {} # type -> set of tasks
+        self._wake = None
+        self._stopping = False
+        self._task = None
+        self._next_periodic = {}
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._loop())
+
+    def notify(self):
+        # Any thread; a no-op outside the app (scripts)
+        if self.loop is not None and not self._stopping:
+            self.loop.call_soon_threadsafe(self._wake.set)
+
+    async def _loop(self):
+        while not self._stopping:
+            try:
+                await self._queue_periodic()
+                await self._dispatch()
+            except Exception as e:
+                print(f"Error dispatching jobs: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.JOBS_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _queue_periodic(self):
+        now = time.monotonic()
+        for job_type in JOB_TYPES.values():
+            if job_type.every and self._next_periodic.get(job_type.name, 0) <= now:
+                self._next_periodic[job_type.name] = now + job_type.every
+                await ensure_queued(job_type.name)
+
+    async def _dispatch(self):
+        for job_type in JOB_TYPES.values():
+            active = self.active.setdefault(job_type.name, set())
+            free = job_type.concurrency - len(active)
+            if free <= 0 or self._stopping:
+                continue
+            for job in await claim(job_type.name, free):
+                task = asyncio.create_task(self._run(job_type, *job))
+                active.add(task)
+                task.add_done_callback(active.discard)
+
+    async def _run(self, job_type, job_id, payload, attempts, max_attempts):
+        try:
+            await job_type.handler(payload)
+        except asyncio.CancelledError:
+            # Shutdown ran out of drain time; the lease expires and it is retried
+            raise
+        except Exception as e:
+            print(f"Job {job_type.name} #{job_id} failed (attempt {attempts}/{max_attempts}): {e}")
+            await fail(job_id, attempts, max_attempts, f"{type(e).__name__}: {e}")
+        else:
+            await complete(job_id)
+        finally:
+            self.notify() # a slot is free
+
+    async def stop(self, timeout: float):
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        running = [task for tasks in self.active.values() for task in tasks]
+        if running:
+            _, unfinished = await asyncio.wait(running, timeout=timeout)
+            for task in unfinished:
+                task.cancel()
+        self.loop = None
+
+runner = Runner()
+
+async def start():
+    await runner.start()
+
+async def stop():
+    global _cpu_executor
+    await runner.stop(settings.JOBS_DRAIN_SECONDS)
+    if _cpu_executor is not None:
+        _cpu_executor.shutdown(wait=False, cancel_futures=True)
+        _cpu_executor = None
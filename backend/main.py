@@ -2,11 +2,21 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import os
-from database import engine, Base
-from routers import auth, config, memoryday, lovelist, album
+from database import engine
+import migrations
+from routers import auth, config, memoryday, lovelist, album, files, sync, home, stats, events as events_router
+import changes # registers the change-log flush hook used by /api/sync
+import events
+import jobs
+import resize
+import utils
+from config import get_settings
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+settings = get_settings()
+
+# Create tables and add missing columns/indexes, one worker at a time (migrations.py)
+if settings.MIGRATE_ON_STARTUP:
+    migrations.migrate(engine)
 
 app = FastAPI(title="情侣小站 API")
 
@@ -17,15 +27,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-# Static files for images
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-# Mount legacy img directory for compatibility with old data
-# Ensure 'static/img' exists or create it
+# Legacy img directory, also served as /media/img/
 os.makedirs("static/img", exist_ok=True)
-app.mount("/img", StaticFiles(directory="static/img"), name="img")
+
+if settings.SERVE_STATIC:
+    # Old unauthenticated URLs; new clients use /media/ (routers/files.py)
+    # Static files for images
+    app.mount("/static", StaticFiles(directory="static"), name="static")
+
+    # Mount legacy img directory for compatibility with old data
+    app.mount("/img", StaticFiles(directory="static/img"), name="img")
 
 
 # Routers
@@ -34,6 +48,33 @@ app.include_router(config.router)
 app.include_router(memoryday.router)
 app.include_router(lovelist.router)
 app.include_router(album.router)
+app.include_router(files.router)
+app.include_router(sync.router)
+app.include_router(home.router)
+app.include_router(stats.router)
+app.include_router(events_router.router)
+
+@app.on_event("startup")
+async def start_events():
+    await events.start()
+
+@app.on_event("startup")
+async def start_jobs():
+    await jobs.start()
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    # Lets running jobs finish (up to JOBS_DRAIN_SECONDS)
+    await jobs.stop()
+
+@app.on_event("shutdown")
+async def stop_events():
+    await events.stop()
+
+@app.on_event("shutdown")
+def shutdown_pools():
+    resize.shutdown_executor()
+    utils.shutdown_hash_executor()
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,186 @@
+import os
+import re
+import sys
+import time
+from sqlalchemy import select, func, or_
+from starlette.concurrency import run_in_threadpool
+from config import get_settings
+from models import AlbumPhoto, MemoryDayPhoto, LoveList, SiteConfig
+from database import SessionLocal, session_scope
+from uploads import UPLOAD_URL_PREFIX, upload_key, upload_url
+from images import VARIANT_SIZES, variant_keys
+from storage import storage
+import jobs
+
+settings = get_settings()
+
+# Uploaded files are content addressed (sha256 + extension, see uploads.py), so one
+# file can back many rows: the same photo in an album, a memory day and a lovelist
+# item is stored once. A file's reference count is the number of rows in these
+# columns that point at its URL; it is deleted when that count drops to zero.
+
+MEDIA_URL_COLUMNS = [
+    AlbumPhoto.url,
+    MemoryDayPhoto.url,
+    LoveList.image_url,
+    SiteConfig.bg_image,
+    SiteConfig.memory_bg,
+    SiteConfig.album_bg,
+    SiteConfig.lovelist_bg,
+    SiteConfig.boy_avatar,
+    SiteConfig.girl_avatar,
+]
+
+# A file this fresh may have just been deduplicated onto by an upload whose row is
+# not committed yet; its release is retried once the grace period is over.
+RELEASE_GRACE_SECONDS = 300
+
+async def count_references(db, url: str) -> int:
+    counts = [
+        select(func.count()).select_from(column.class_).where(column == url).scalar_subquery()
+        for column in MEDIA_URL_COLUMNS
+    ]
+    row = (await db.execute(select(*counts))).one()
+    return sum(row)
+
+def _remove_file(key) -> float:
+    # 0 once the file is gone, else the seconds left of its grace period
+    stored = storage.stat(key)
+    if stored is None:
+        return 0
+    wait = RELEASE_GRACE_SECONDS - (time.time() - stored.mtime)
+    if wait > 0:
+        return wait
+    storage.delete(key)
+    # Derived thumbnails are keyed by the same content hash
+    storage.delete_many(variant_keys(key))
+    return 0
+
+async def release_media(db, urls, delay: float = 0):
+    # Call after the commit that dropped the references. Deletion happens in a
+    # background job; anything missed (crash) is left to the orphan sweep
+    urls = sorted({url for url in urls if url and upload_key(url) is not None})
+    if urls:
+        await jobs.enqueue(db, "release_media", {"urls": urls}, delay=delay)
+
+@jobs.register("release_media")
+async def release_media_job(payload):
+    async with session_scope() as db:
+        removed, waiting = await remove_unreferenced(db, payload.get("urls", []))
+        if waiting:
+            await release_media(db, list(waiting), delay=max(waiting.values()) + 1)
+
+async def remove_unreferenced(db, urls):
+    # (removed urls, {url: seconds left} for the ones still in their grace period)
+    removed, waiting = [], {}
+    for url in set(filter(None, urls)):
+        key = upload_key(url)
+        if key is None or await count_references(db, url) > 0:
+            continue
+        wait = await run_in_threadpool(_remove_file, key)
+        if wait:
+            waiting[url] = wait
+        else:
+            removed.append(url)
+    return removed, waiting
+
+# Orphan sweep. Rows can drop files without release_media ever seeing them (avatars
+# uploaded but never saved into the config, older deletes, crashes), so this
+# mark-and-sweep pass walks the storage (UPLOAD_DIR or the bucket) and removes
+# files no URL column points at. The listing is streamed and checked against the
+# database a batch at a time, so memory stays flat however many files there are.
+# Anything modified within MEDIA_GC_GRACE_HOURS is left alone: it may belong to an
+# upload whose row isn't committed yet (dedupe refreshes the mtime, see
+# uploads._store).
+
+VARIANT_NAME = re.compile(r"^(?P<stem>.+)_(?:%s|poster)\.\w+$" % "|".join(str(size) for size in VARIANT_SIZES))
+
+def _referenced(db, urls):
+    live = set()
+    for column in MEDIA_URL_COLUMNS:
+        live.update(db.scalars(select(column).where(column.in_(urls))))
+    return live
+
+def _referenced_stems(db, stems):
+    # Stems with an original still in use: a variant lives and dies with its
+    # original, and asking the database avoids probing storage per extension
+    live = set()
+    for column in MEDIA_URL_COLUMNS:
+        prefixes = [column.like(f"{UPLOAD_URL_PREFIX}{stem}.%") for stem in stems]
+        for url in db.scalars(select(column).where(or_(*prefixes))):
+            live.add(os.path.splitext(upload_key(url) or "")[0])
+    return live
+
+def _sweep(db, batch, stats, dry_run, cutoff, report):
+    live = _referenced(db, [upload_url(item.key) for item in batch])
+    variants = {item.key: VARIANT_NAME.match(item.key) for item in batch}
+    stems = {match.group("stem") for match in variants.values() if match}
+    live_stems = _referenced_stems(db, sorted(stems)) if stems else set()
+    for item in batch:
+        if upload_url(item.key) in live:
+            stats["live"] += 1
+            continue
+        match = variants[item.key]
+        if match and match.group("stem") in live_stems:
+            stats["live"] += 1
+            continue
+        stored = storage.stat(item.key)
+        if stored is None:
+            continue
+        if stored.mtime >= cutoff:
+            # Touched since it was listed (deduplicated onto by a new upload)
+            stats["young"] += 1
+            continue
+        # Variants of an orphan are orphans too and are listed on their own
+        if not dry_run:
+            storage.delete(item.key)
+        stats["orphaned"] += 1
+        stats["orphaned_bytes"] += stored.size
+        if report:
+            report(item.key, stored.size)
+
+def collect_orphans(dry_run=False, grace_hours=None, batch_size=1000, report=None):
+    # Blocking; returns counters. report(key, size) is called for every orphan
+    grace_hours = settings.MEDIA_GC_GRACE_HOURS if grace_hours is None else grace_hours
+    cutoff = time.time() - grace_hours * 3600
+    stats = {"scanned": 0, "young": 0, "live": 0, "orphaned": 0, "orphaned_bytes": 0}
+    db = SessionLocal()
+    try:
+        batch = []
+        # Hidden keys (in-flight and resumable uploads) are not listed
+        for item in storage.list():
+            stats["scanned"] += 1
+            if item.mtime >= cutoff:
+                stats["young"] += 1
+                continue
+            batch.append(item)
+            if len(batch) >= batch_size:
+                _sweep(db, batch, stats, dry_run, cutoff, report)
+                batch = []
+        if batch:
+            _sweep(db, batch, stats, dry_run, cutoff, report)
+    finally:
+        db.close()
+    return stats
+
+@jobs.register("media_gc", every=settings.MEDIA_GC_INTERVAL_HOURS * 3600)
+async def media_gc_job(payload):
+    stats = await run_in_threadpool(collect_orphans)
+    print(f"Media GC: {stats}")
+
+if __name__ == "__main__":
+    # Manual run: python media.py [--dry-run] [--grace-hours N]
+    dry_run = "--dry-run" in sys.argv
+    grace_hours = None
+    if "--grace-hours" in sys.argv:
+        grace_hours = float(sys.argv[sys.argv.index("--grace-hours") + 1])
+    stats = collect_orphans(
+        dry_run=dry_run,
+        grace_hours=grace_hours,
+        report=lambda key, size: print(f"{'Would remove' if dry_run else 'Removed'} {key} ({size} bytes)"),
+    )
+    print(
+        f"Scanned {stats['scanned']} files: {stats['live']} referenced, {stats['young']} within the grace period, "
+        f"{stats['orphaned']} orphaned ({stats['orphaned_bytes'] / 1024 / 1024:.1f} MB)"
+        + (" - dry run, nothing deleted" if dry_run else "")
+    )
@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+from database import engine, Base
+
+# Base.metadata.create_all only creates missing tables; it never alters existing ones.
+# upgrade() brings an existing deployment up to date with what models.py declares.
+# It is idempotent; migrate() runs both on every startup (MIGRATE_ON_STARTUP), or
+# once per deploy with `python migrations.py`.
+#
+# Every uvicorn worker imports main, so several processes migrate at once and
+# their DDL races (duplicate column/index errors). On MySQL they queue on a named
+# lock: the first one migrates, the others then find nothing left to do.
+
+LOCK_NAME = "qlxz_migrations"
+LOCK_TIMEOUT_SECONDS = 300
+
+@contextmanager
+def migration_lock(bind):
+    if bind.dialect.name != "mysql":
+        yield
+        return
+    with bind.connect() as conn:
+        if conn.scalar(text("SELECT GET_LOCK(:name, :timeout)"), {"name": LOCK_NAME, "timeout": LOCK_TIMEOUT_SECONDS}) != 1:
+            raise RuntimeError(f"Timed out waiting for the {LOCK_NAME} lock")
+        try:
+            yield
+        finally:
+            conn.scalar(text("SELECT RELEASE_LOCK(:name)"), {"name": LOCK_NAME})
+
+def migrate(bind=engine):
+    # Create tables, then add columns/indexes that existing tables are missing
+    with migration_lock(bind):
+        Base.metadata.create_all(bind=bind)
+        return upgrade(bind)
+
+# Indexes models.py no longer declares, dropped once their replacement exists
+OBSOLETE_INDEXES = {
+    # covered by ix_album_comments_album_created_id (album_id, created_at, id)
+    "album_comments": ["ix_album_comments_album_id"],
+}
+
+def upgrade(bind=engine):
+    inspector = inspect(bind)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        columns = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                with bind.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                created.append(f"{table.name}.{column.name}")
+
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name not in existing:
+                index.create(bind)
+                created.append(f"{table.name}.{index.name}")
+
+        for name in OBSOLETE_INDEXES.get(table.name, []):
+            if name in existing:
+                on_table = f" ON {table.name}" if bind.dialect.name == "mysql" else ""
+                with bind.begin() as conn:
+                    conn.execute(text(f"DROP INDEX {name}{on_table}"))
+                created.append(f"dropped {table.name}.{name}")
+    return created
+
+if __name__ == "__main__":
+    # Manual run: python migrations.py (before starting the workers with
+    # MIGRATE_ON_STARTUP=false)
+    import models # registers the tables
+    changes = migrate()
+    if changes:
+        for change in changes:
+            print(change if change.startswith("dropped ") else f"Created {change}")
+    else:
+        print("Schema is up to date")
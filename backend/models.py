@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Date, DateTime, Text
+from sqlalchemy import BigInteger, Boolean, Column, ForeignKey, Float, Index, Integer, JSON, String, Date, DateTime, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -12,6 +12,8 @@ class User(Base):
     hashed_password = Column(String(100))
     is_active = Column(Boolean, default=True)
     role = Column(String(20), default="admin") # boy, girl, admin
+    # Bumped on password change; tokens carry it as "ver" and older ones stop working
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
 class SiteConfig(Base):
     __tablename__ = "site_config"
@@ -28,10 +30,14 @@ class SiteConfig(Base):
     boy_avatar = Column(String(255), nullable=True)
     girl_avatar = Column(String(255), nullable=True)
     site_title = Column(String(100))
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 class MemoryDay(Base):
     __tablename__ = "memory_days"
-    __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'}
+    __table_args__ = (
+        Index("ix_memory_days_date_id", "date", "id"),  # keyset pagination
+        {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'},
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(100), index=True)
@@ -39,47 +45,70 @@ class MemoryDay(Base):
     description = Column(Text, nullable=True)
     icon = Column(String(50), default="❤️")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
-    photos = relationship("MemoryDayPhoto", back_populates="memory_day", cascade="all, delete-orphan")
+    # selectin: a page of memory days loads all its photos in one extra query instead of one per day
+    photos = relationship("MemoryDayPhoto", back_populates="memory_day", cascade="all, delete-orphan", lazy="selectin")
 
 class MemoryDayPhoto(Base):
     __tablename__ = "memory_day_photos"
     __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'}
     
     id = Column(Integer, primary_key=True, index=True)
-    memory_day_id = Column(Integer, ForeignKey("memory_days.id"))
-    url = Column(String(255))
+    memory_day_id = Column(Integer, ForeignKey("memory_days.id"), index=True)
+    url = Column(String(255), index=True) # indexed for media reference counting
+    variants = Column(JSON, nullable=True) # [{width, height, url}] smallest first, see images.py
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    placeholder = Column(Text, nullable=True) # inline LQIP data URI
+    poster = Column(String(255), nullable=True) # videos: frame URL, see videos.py
+    duration = Column(Float, nullable=True) # videos: seconds
     
     memory_day = relationship("MemoryDay", back_populates="photos")
 
 class Album(Base):
     __tablename__ = "albums"
-    __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'}
+    __table_args__ = (
+        Index("ix_albums_date_id", "date", "id"),  # keyset pagination
+        {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'},
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     description = Column(Text) # from imgText
     date = Column(Date) # from imgDatd
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
-    photos = relationship("AlbumPhoto", back_populates="album", cascade="all, delete-orphan")
-    comments = relationship("AlbumComment", back_populates="album", cascade="all, delete-orphan")
+    # selectin: list endpoints serialize photos and comments for every album,
+    # so load each relationship for the whole page in one query (no N+1)
+    photos = relationship("AlbumPhoto", back_populates="album", cascade="all, delete-orphan", lazy="selectin")
+    comments = relationship("AlbumComment", back_populates="album", cascade="all, delete-orphan", lazy="selectin")
 
 class AlbumPhoto(Base):
     __tablename__ = "album_photos"
     __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'}
     
     id = Column(Integer, primary_key=True, index=True)
-    album_id = Column(Integer, ForeignKey("albums.id"))
-    url = Column(String(255))
+    album_id = Column(Integer, ForeignKey("albums.id"), index=True)
+    url = Column(String(255), index=True) # indexed for media reference counting
+    variants = Column(JSON, nullable=True) # [{width, height, url}] smallest first, see images.py
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    placeholder = Column(Text, nullable=True) # inline LQIP data URI
+    poster = Column(String(255), nullable=True) # videos: frame URL, see videos.py
+    duration = Column(Float, nullable=True) # videos: seconds
     
     album = relationship("Album", back_populates="photos")
     
 class AlbumComment(Base):
     __tablename__ = "album_comments"
-    __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'}
+    __table_args__ = (
+        Index("ix_album_comments_album_created_id", "album_id", "created_at", "id"),  # comment pages
+        {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'},
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    album_id = Column(Integer, ForeignKey("albums.id"))
+    album_id = Column(Integer, ForeignKey("albums.id")) # indexed by ix_album_comments_album_created_id
     username = Column(String(50))
     content = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -88,10 +117,72 @@ class AlbumComment(Base):
 
 class LoveList(Base):
     __tablename__ = "love_list"
-    __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'}
+    __table_args__ = (
+        Index("ix_love_list_created_at_id", "created_at", "id"),  # keyset pagination
+        {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'},
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255))
     is_completed = Column(Boolean, default=False)
-    image_url = Column(String(255), nullable=True)
+    image_url = Column(String(255), nullable=True, index=True)
+    image_width = Column(Integer, nullable=True)
+    image_height = Column(Integer, nullable=True)
+    image_placeholder = Column(Text, nullable=True) # inline LQIP data URI
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class UploadSession(Base):
+    # Resumable (chunked) album upload in progress; bytes live under uploads.resumable_key(id)
+    __tablename__ = "upload_sessions"
+    __table_args__ = {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'}
+
+    id = Column(String(32), primary_key=True)
+    album_id = Column(Integer, ForeignKey("albums.id", ondelete="CASCADE"), index=True)
+    # Only the user who started the upload may add to, finish or abort it
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
+    filename = Column(String(255))
+    size = Column(BigInteger)
+    chunk_size = Column(Integer)
+    received = Column(BigInteger, default=0)
+    # Storage multipart upload id (S3 UploadId; None for local storage)
+    storage_token = Column(String(255), nullable=True)
+    # Set by complete; the session stays until it expires so a retried complete
+    # gets the same photo back
+    photo_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
+
+class ChangeLog(Base):
+    # Append-only log of writes to synced entities (see changes.py); the id is the sync token
+    __tablename__ = "change_log"
+    __table_args__ = (
+        Index("ix_change_log_entity_id", "entity", "id"),
+        {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'},
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    entity = Column(String(20)) # album, memoryday, lovelist, config
+    entity_id = Column(Integer)
+    op = Column(String(10)) # upsert, delete
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Job(Base):
+    # Persistent background work (see jobs.py). Rows are deleted once they succeed;
+    # ones that ran out of attempts stay with status "failed" and the last error.
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_type_status_run_at", "type", "status", "run_at"),  # claiming
+        {'mysql_charset': 'utf8mb4', 'mysql_collate': 'utf8mb4_unicode_ci'},
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    type = Column(String(50))
+    payload = Column(JSON, nullable=True)
+    status = Column(String(20), default="pending") # pending, running, failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    run_at = Column(DateTime, server_default=func.now()) # not before
+    locked_until = Column(DateTime, nullable=True) # lease while running; expired leases are retried
+    last_error = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,62 @@
+import base64
+import json
+from typing import Optional
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, or_
+
+# Keyset (cursor) pagination for feeds ordered by (sort column DESC, id DESC).
+# The cursor is an opaque base64 token holding the last row's sort value and id,
+# so page N costs the same as page 1 (index range scan instead of OFFSET).
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(value, item_id: int) -> str:
+    raw = json.dumps([value.isoformat() if value is not None else None, item_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, sort_col):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, item_id = json.loads(base64.urlsafe_b64decode(padded))
+        if value is not None:
+            value = sort_col.type.python_type.fromisoformat(value)
+        return value, int(item_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(sort_col, id_col, cursor: str):
+    value, last_id = decode_cursor(cursor, sort_col)
+    # MySQL sorts NULLs last in DESC order, so they come after every dated row
+    if value is None:
+        return and_(sort_col.is_(None), id_col < last_id)
+    return or_(
+        sort_col < value,
+        and_(sort_col == value, id_col < last_id),
+        sort_col.is_(None),
+    )
+
+async def fetch_page(db, stmt, sort_col, id_col, skip: int, limit: int, cursor: Optional[str]):
+    stmt = stmt.order_by(sort_col.desc(), id_col.desc())
+    if cursor:
+        stmt = stmt.where(keyset_filter(sort_col, id_col, cursor))
+    else:
+        # Legacy offset paging for old clients
+        stmt = stmt.offset(skip)
+    if len(stmt.column_descriptions) > 1:
+        # Column select: rows, whose attributes are the column labels
+        items = (await db.execute(stmt.limit(limit))).all()
+    else:
+        items = (await db.scalars(stmt.limit(limit))).all()
+
+    next_cursor = None
+    if limit > 0 and len(items) == limit:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_col.key), getattr(last, id_col.key))
+    return items, next_cursor
+
+async def paginate(db, stmt, sort_col, id_col, response: Response, skip: int, limit: int, cursor: Optional[str]):
+    items, next_cursor = await fetch_page(db, stmt, sort_col, id_col, skip, limit, cursor)
+    # The body stays a plain list for old clients; the next page token goes in a header
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return items
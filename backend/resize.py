@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from config import get_settings
+from images import OUTPUT_FORMATS, resize_image
+from storage import storage
+
+settings = get_settings()
+
+# On-demand resizing for /media: results are cached on disk under MEDIA_CACHE_DIR and
+# evicted least-recently-used once the cache exceeds MEDIA_CACHE_MAX_MB. Concurrent
+# requests for the same rendition share one resize, and Pillow runs in a process
+# pool so CPU work never blocks the event loop. Uploads in object storage are
+# fetched to a temp file for the render; the cache itself is local to each server.
+
+# URL prefix -> directory served through /media/<prefix>/...
+MEDIA_ROOTS = {
+    "uploads": settings.UPLOAD_DIR,
+    "img": "static/img", # legacy files, see main.py
+}
+
+MAX_DIMENSION = 4096
+
+def remote_key(path: str):
+    # Storage key for /media/uploads/<key> when uploads live in object storage, else None
+    root_name, _, rest = path.partition("/")
+    if root_name != "uploads" or storage.is_local:
+        return None
+    if not rest or "/" in rest or rest.startswith("."):
+        raise HTTPException(status_code=404, detail="Not found")
+    return rest
+
+def resolve_source(path: str) -> str:
+    root_name, _, rest = path.partition("/")
+    root = MEDIA_ROOTS.get(root_name)
+    if root is None or not rest:
+        raise HTTPException(status_code=404, detail="Not found")
+    root = os.path.realpath(root)
+    source = os.path.realpath(os.path.join(root, rest))
+    # No escaping the media roots, nothing hidden at any depth (temp files,
+    # .sessions/ with other users' resumable uploads)
+    if os.path.commonpath([root, source]) != root:
+        raise HTTPException(status_code=404, detail="Not found")
+    if any(part.startswith(".") for part in os.path.relpath(source, root).split(os.sep)):
+        raise HTTPException(status_code=404, detail="Not found")
+    if not os.path.isfile(source):
+        raise HTTPException(status_code=404, detail="Not found")
+    return source
+
+class DiskCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = None # computed on first use
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}{extension}")
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def _ensure_total(self):
+        if self.total_bytes is None:
+            self.total_bytes = sum(size for _, size, _ in self._entries())
+
+    def hit(self, path: str) -> bool:
+        # Blocking. mtime doubles as the LRU timestamp
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def added(self, size: int):
+        # Blocking. Evict oldest entries down to 90% of the budget
+        with self._lock:
+            self._ensure_total()
+            self.total_bytes += size
+            if self.total_bytes <= self.max_bytes:
+                return
+            target = self.max_bytes * 0.9
+            for _, entry_size, path in sorted(self._entries()):
+                if self.total_bytes <= target:
+                    break
+                try:
+                    os.remove(path)
+                    self.total_bytes -= entry_size
+                except FileNotFoundError:
+                    pass
+
+cache = DiskCache(settings.MEDIA_CACHE_DIR, settings.MEDIA_CACHE_MAX_MB * 1024 * 1024)
+
+_executor = None
+_inflight = {}
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.MEDIA_RESIZE_WORKERS)
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def source_stat(path: str):
+    # Blocking. (source, storage key or None, mtime_ns, size)
+    key = remote_key(path)
+    if key is None:
+        source = resolve_source(path)
+        st = os.stat(source)
+        return source, None, st.st_mtime_ns, st.st_size
+    stored = storage.stat(key)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return f"{storage.name}:{key}", key, int(stored.mtime * 1e9), stored.size
+
+async def _render(source, key, cached, width, height, fmt, quality):
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    if key is not None:
+        source = await run_in_threadpool(storage.fetch, key)
+    try:
+        loop = asyncio.get_running_loop()
+        size = await loop.run_in_executor(
+            get_executor(), resize_image, source, cached, width, height, fmt, quality
+        )
+    finally:
+        if key is not None:
+            await run_in_threadpool(storage.release, source)
+    await run_in_threadpool(cache.added, size)
+
+async def get_resized(path: str, width, height, fmt: str, quality: int):
+    if fmt not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    source, source_key, mtime_ns, size = await run_in_threadpool(source_stat, path)
+
+    # Source mtime/size are part of the key, so a replaced legacy file re-renders
+    raw_key = f"{source}|{mtime_ns}|{size}|{width}|{height}|{fmt}|{quality}"
+    key = hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+    _, extension, content_type = OUTPUT_FORMATS[fmt]
+    cached = cache.path_for(key, extension)
+
+    if await run_in_threadpool(cache.hit, cached):
+        return cached, content_type
+
+    # Coalesce: the first request renders, the rest await the same future
+    pending = _inflight.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(_render(source, source_key, cached, width, height, fmt, quality))
+        _inflight[key] = pending
+        pending.add_done_callback(lambda _: _inflight.pop(key, None))
+    try:
+        await asyncio.shield(pending)
+    except Exception as e:
+        print(f"Error resizing {path}: {e}")
+        raise HTTPException(status_code=415, detail="Cannot resize this file")
+    return cached, content_type
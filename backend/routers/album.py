@@ -1,13 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from typing import List
-import shutil
-import os
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Path, Request, Response
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import uuid
 from database import get_db
-from models import Album, AlbumPhoto, AlbumComment, User
-from schemas import Album as AlbumSchema, AlbumCreate, AlbumCommentCreate
+from models import Album, AlbumPhoto, AlbumComment, UploadSession, User
+from schemas import Album as AlbumSchema, AlbumSummary, AlbumPhoto as AlbumPhotoSchema, AlbumComment as AlbumCommentSchema, AlbumCreate, AlbumCommentCreate, UploadSession as UploadSessionSchema, UploadSessionCreate
 from dependencies import get_current_user
+from pagination import paginate
+from conditional import conditional
+from fastjson import json_response
+from uploads import (
+    save_upload, public_url, MEDIA, RESUMABLE_CHUNK_SIZE, RESUMABLE_MAX_BYTES,
+    start_resumable, write_chunk, finish_resumable, discard_resumable,
+)
+from media import release_media
+from images import schedule_processing
 from config import get_settings
 
 settings = get_settings()
@@ -18,38 +27,111 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-@router.get("/", response_model=List[AlbumSchema])
-def read_albums(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    items = db.query(Album).order_by(Album.date.desc()).offset(skip).limit(limit).all()
-    return items
+@router.get("/", response_model=List[AlbumSchema], dependencies=[Depends(conditional("album"))])
+async def read_albums(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    items = await paginate(db, select(Album), Album.date, Album.id, response, skip, limit, cursor)
+    return json_response(items, List[AlbumSchema], response)
+
+@router.get("/summary", response_model=List[AlbumSummary], dependencies=[Depends(conditional("album"))])
+async def read_album_summaries(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    # Same feed and cursors as read_albums, but counts and the cover come from
+    # correlated subqueries (ix on album_id) instead of loading every photo and comment
+    cover_id = (
+        select(AlbumPhoto.id).where(AlbumPhoto.album_id == Album.id)
+        .order_by(AlbumPhoto.id).limit(1).scalar_subquery()
+    )
+    photo_count = select(func.count(AlbumPhoto.id)).where(AlbumPhoto.album_id == Album.id).scalar_subquery()
+    comment_count = select(func.count(AlbumComment.id)).where(AlbumComment.album_id == Album.id).scalar_subquery()
+    stmt = select(
+        Album.id, Album.description, Album.date, Album.created_at,
+        cover_id.label("cover_id"), photo_count.label("photo_count"), comment_count.label("comment_count"),
+    )
+    rows = await paginate(db, stmt, Album.date, Album.id, response, skip, limit, cursor)
+
+    cover_ids = [row.cover_id for row in rows if row.cover_id is not None]
+    covers = {}
+    if cover_ids:
+        covers = {photo.id: photo for photo in await db.scalars(select(AlbumPhoto).where(AlbumPhoto.id.in_(cover_ids)))}
+    items = [
+        {
+            "id": row.id,
+            "description": row.description,
+            "date": row.date,
+            "created_at": row.created_at,
+            "cover": covers.get(row.cover_id),
+            "photo_count": row.photo_count,
+            "comment_count": row.comment_count,
+        }
+        for row in rows
+    ]
+    return json_response(items, List[AlbumSummary], response)
+
+async def get_album_id(db, item_id: int) -> int:
+    if await db.scalar(select(Album.id).where(Album.id == item_id)) is None:
+        raise HTTPException(status_code=404, detail="Album not found")
+    return item_id
+
+@router.get("/{item_id}/photos", response_model=List[AlbumPhotoSchema], dependencies=[Depends(conditional("album"))])
+async def read_album_photos(response: Response, item_id: int, db: AsyncSession = Depends(get_db)):
+    await get_album_id(db, item_id)
+    photos = (await db.scalars(
+        select(AlbumPhoto).where(AlbumPhoto.album_id == item_id).order_by(AlbumPhoto.id)
+    )).all()
+    return json_response(photos, List[AlbumPhotoSchema], response)
+
+@router.get("/{item_id}/comments", response_model=List[AlbumCommentSchema], dependencies=[Depends(conditional("album"))])
+async def read_album_comments(
+    response: Response,
+    item_id: int,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    # Newest first; X-Next-Cursor fetches older comments
+    await get_album_id(db, item_id)
+    stmt = select(AlbumComment).where(AlbumComment.album_id == item_id)
+    comments = await paginate(db, stmt, AlbumComment.created_at, AlbumComment.id, response, 0, limit, cursor)
+    return json_response(comments, List[AlbumCommentSchema], response)
 
 @router.post("/", response_model=AlbumSchema)
-def create_album(
+async def create_album(
     item: AlbumCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     db_item = Album(description=item.description, date=item.date)
     db.add(db_item)
-    db.flush() # Get ID
+    await db.flush() # Get ID
     
     # Add photos if URLs provided
     for photo_url in item.photos:
         db_photo = AlbumPhoto(album_id=db_item.id, url=photo_url)
         db.add(db_photo)
     
-    db.commit()
-    db.refresh(db_item)
+    await db.commit()
+    await db.refresh(db_item)
     return db_item
 
 @router.put("/{item_id}", response_model=AlbumSchema)
-def update_album(
+async def update_album(
     item_id: int,
     item: AlbumCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    db_item = db.query(Album).filter(Album.id == item_id).first()
+    db_item = await db.get(Album, item_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Item not found")
     
@@ -63,90 +145,198 @@ def update_album(
     # If we want to support sync photos list, we need more logic (delete removed, add new).
     # Given the UI usually just adds photos, let's focus on Description/Date first which are missing.
     
-    db.commit()
-    db.refresh(db_item)
+    await db.commit()
+    await db.refresh(db_item)
     return db_item
 
 @router.delete("/{item_id}")
-def delete_album(
+async def delete_album(
     item_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    db_item = db.query(Album).filter(Album.id == item_id).first()
+    db_item = await db.get(Album, item_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Item not found")
         
-    db.delete(db_item)
-    db.commit()
+    photo_urls = [photo.url for photo in db_item.photos]
+    await db.delete(db_item)
+    await db.commit()
+    await release_media(db, photo_urls)
     return {"ok": True}
 
 @router.post("/upload")
 async def upload_album_photo(
     file: UploadFile = File(...),
     album_id: int = Form(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     # Validate album exists
-    db_album = db.query(Album).filter(Album.id == album_id).first()
-    if not db_album:
+    if await db.scalar(select(Album.id).where(Album.id == album_id)) is None:
         raise HTTPException(status_code=404, detail="Album not found")
     
-    # Generate unique filename
-    extension = os.path.splitext(file.filename)[1]
-    filename = f"album_{uuid.uuid4()}{extension}"
-    
-    # Create upload dir
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-    file_path = os.path.join(settings.UPLOAD_DIR, filename)
+    # Albums accept photos and videos
+    stored = await save_upload(file, kinds=MEDIA)
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Save photo to database (a retried upload of the same file reuses its row)
+    relative_path = stored.url
+    photo_id = await db.scalar(
+        select(AlbumPhoto.id).where(AlbumPhoto.album_id == album_id, AlbumPhoto.url == relative_path)
+    )
+    if photo_id is None:
+        db_photo = AlbumPhoto(album_id=album_id, url=relative_path)
+        db.add(db_photo)
+        await db.commit()
+        photo_id = db_photo.id
     
-    # Save photo to database
-    relative_path = f"/static/uploads/{filename}"
-    db_photo = AlbumPhoto(album_id=album_id, url=relative_path)
+    # Thumbnails, size and placeholder are computed by a background job
+    await schedule_processing(db, AlbumPhoto, photo_id)
+    return {"url": public_url(relative_path)}
+
+# Resumable uploads for large videos:
+# POST /uploads -> PUT /uploads/{id}/chunks/{n} (repeat) -> POST /uploads/{id}/complete
+# After a dropped connection, GET /uploads/{id} tells the client which chunk to resend;
+# a retried complete returns the photo the first one created.
+
+@router.post("/uploads", response_model=UploadSessionSchema)
+async def create_upload_session(
+    item: UploadSessionCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if await db.scalar(select(Album.id).where(Album.id == item.album_id)) is None:
+        raise HTTPException(status_code=404, detail="Album not found")
+    if item.size <= 0 or item.size > RESUMABLE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    db_upload = UploadSession(
+        id=uuid.uuid4().hex,
+        album_id=item.album_id,
+        user_id=current_user.id,
+        filename=item.filename,
+        size=item.size,
+        chunk_size=RESUMABLE_CHUNK_SIZE,
+        received=0
+    )
+    db_upload.storage_token = await run_in_threadpool(start_resumable, db_upload.id)
+    db.add(db_upload)
+    await db.commit()
+    return db_upload
+
+async def get_upload_session(upload_id: str, db: AsyncSession, user: User, lock: bool = False):
+    db_upload = await db.get(UploadSession, upload_id, with_for_update=lock)
+    # Someone else's session is reported as missing, not forbidden
+    if not db_upload or db_upload.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return db_upload
+
+def check_not_completed(db_upload: UploadSession):
+    if db_upload.photo_id is not None:
+        raise HTTPException(status_code=409, detail="Upload already completed")
+
+@router.get("/uploads/{upload_id}", response_model=UploadSessionSchema)
+async def read_upload_session(
+    upload_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    return await get_upload_session(upload_id, db, current_user)
+
+@router.put("/uploads/{upload_id}/chunks/{index}", response_model=UploadSessionSchema)
+async def upload_chunk(
+    request: Request,
+    upload_id: str,
+    index: int = Path(..., ge=0),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    db_upload = await get_upload_session(upload_id, db, current_user)
+    check_not_completed(db_upload)
+    offset = index * db_upload.chunk_size
+    if offset > db_upload.received:
+        raise HTTPException(status_code=409, detail=f"Expected chunk {db_upload.received // db_upload.chunk_size}")
+    if offset >= db_upload.size:
+        raise HTTPException(status_code=416, detail="Chunk out of range")
+
+    # Chunks are numbered, so a retried chunk simply overwrites from its offset
+    expected = min(db_upload.chunk_size, db_upload.size - offset)
+    written = await write_chunk(upload_id, db_upload.storage_token, index, offset, request.stream(), expected)
+    if written != expected:
+        raise HTTPException(status_code=400, detail=f"Chunk must be {expected} bytes")
+
+    db_upload.received = offset + written
+    await db.commit()
+    return db_upload
+
+@router.post("/uploads/{upload_id}/complete")
+async def complete_upload_session(
+    upload_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    # Locked, so a concurrent retry waits for this one and then sees photo_id
+    db_upload = await get_upload_session(upload_id, db, current_user, lock=True)
+    if db_upload.photo_id is not None:
+        # Retried after a lost response: same answer as the first time
+        db_photo = await db.get(AlbumPhoto, db_upload.photo_id)
+        if db_photo is None:
+            raise HTTPException(status_code=404, detail="Photo not found")
+        return {"url": public_url(db_photo.url), "id": db_photo.id}
+    if db_upload.received != db_upload.size:
+        raise HTTPException(status_code=409, detail=f"Upload incomplete ({db_upload.received}/{db_upload.size})")
+
+    stored = await run_in_threadpool(finish_resumable, upload_id, db_upload.storage_token)
+
+    db_photo = AlbumPhoto(album_id=db_upload.album_id, url=stored.url)
     db.add(db_photo)
-    db.commit()
-    
-    return {"url": relative_path}
+    await db.flush()
+    db_upload.photo_id = db_photo.id
+    db_upload.storage_token = None
+    await db.commit()
+
+    await schedule_processing(db, AlbumPhoto, db_photo.id)
+    return {"url": public_url(stored.url), "id": db_photo.id}
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload_session(
+    upload_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    db_upload = await get_upload_session(upload_id, db, current_user)
+    if db_upload.photo_id is None:
+        await run_in_threadpool(discard_resumable, upload_id, db_upload.storage_token)
+    await db.delete(db_upload)
+    await db.commit()
+    return {"ok": True}
 
 @router.delete("/photo/{photo_id}")
-def delete_album_photo(
+async def delete_album_photo(
     photo_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    db_photo = db.query(AlbumPhoto).filter(AlbumPhoto.id == photo_id).first()
+    db_photo = await db.get(AlbumPhoto, photo_id)
     if not db_photo:
         raise HTTPException(status_code=404, detail="Photo not found")
         
-    # Delete file from disk
-    if db_photo.url.startswith("/static/uploads/"):
-         filename = os.path.basename(db_photo.url)
-         file_path = os.path.join(settings.UPLOAD_DIR, filename)
-         if os.path.exists(file_path):
-             try:
-                 os.remove(file_path)
-             except Exception as e:
-                 print(f"Error deleting file: {e}")
-
-    db.delete(db_photo)
-    db.commit()
+    url = db_photo.url
+    await db.delete(db_photo)
+    await db.commit()
+    # Delete file from disk unless another row still uses it
+    await release_media(db, [url])
     return {"ok": True}
 
-@router.post("/{item_id}/comments", response_model=AlbumSchema)
-def create_comment(
+@router.post("/{item_id}/comments", response_model=AlbumCommentSchema)
+async def create_comment(
     item_id: int,
     comment: AlbumCommentCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    # Verify album exists
-    db_album = db.query(Album).filter(Album.id == item_id).first()
-    if not db_album:
-        raise HTTPException(status_code=404, detail="Album not found")
+    # Verify album exists (without loading its photos and comments)
+    await get_album_id(db, item_id)
         
     # Create comment
     # Use the username from the request body as per schema design (simplicity)
@@ -162,6 +352,7 @@ def create_comment(
         content=comment.content
     )
     db.add(db_comment)
-    db.commit()
-    db.refresh(db_album) # Refresh album to include new comment
-    return db_album
+    await db.commit()
+    await db.refresh(db_comment) # server-side created_at
+    # Just the new comment; the thread is at GET /{item_id}/comments
+    return db_comment
@@ -1,12 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 from database import get_db
 from models import User
 from schemas import Token, UserCreate, User as UserSchema, UserPasswordUpdate
-from dependencies import get_current_user
-from utils import verify_password, get_password_hash, create_access_token
+from dependencies import get_current_user, invalidate_user, MEDIA_SCOPE
+from utils import verify_password_async, get_password_hash_async, needs_rehash, create_access_token
 from config import get_settings
 
 router = APIRouter(
@@ -17,46 +18,75 @@ router = APIRouter(
 
 settings = get_settings()
 
+def issue_token(user: User) -> str:
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    return create_access_token(
+        data={"sub": user.username, "ver": user.token_version}, expires_delta=access_token_expires
+    )
+
+def issue_media_token(user: User) -> str:
+    # Only good for /media, and short-lived: it ends up in URLs, logs and Referer headers
+    return create_access_token(
+        data={"sub": user.username, "ver": user.token_version, "scope": MEDIA_SCOPE},
+        expires_delta=timedelta(minutes=settings.MEDIA_TOKEN_MINUTES),
+    )
+
 @router.post("/login", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(User).where(User.username == form_data.username))
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    if needs_rehash(user.hashed_password):
+        # BCRYPT_ROUNDS changed since this hash was made; upgrade it while we have the password
+        user.hashed_password = await get_password_hash_async(form_data.password)
+        await db.commit()
+    return {"access_token": issue_token(user), "token_type": "bearer"}
+
+# For <img>/<video> URLs: /media/uploads/<key>?token=<media_token>. Reuse one
+# token until it nears expiry so the URLs (and the browser cache) stay stable.
+@router.get("/media-token")
+async def read_media_token(current_user: User = Depends(get_current_user)):
+    return {
+        "media_token": issue_media_token(current_user),
+        "token_type": "media",
+        "expires_in": settings.MEDIA_TOKEN_MINUTES * 60,
+    }
 
 # For creating initial users or debugging
 @router.post("/register", response_model=UserSchema)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = await db.scalar(select(User).where(User.username == user.username))
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = User(username=user.username, hashed_password=hashed_password, role="admin")
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @router.post("/change-password")
-def change_password(
+async def change_password(
     password_data: UserPasswordUpdate, 
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_db), 
     current_user: User = Depends(get_current_user)
 ):
-    if not verify_password(password_data.old_password, current_user.hashed_password):
+    if not await verify_password_async(password_data.old_password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect old password"
         )
     
-    current_user.hashed_password = get_password_hash(password_data.new_password)
-    db.commit()
-    return {"message": "Password updated successfully"}
+    # current_user may be the cached copy; change the row through this session
+    user = await db.get(User, current_user.id)
+    user.hashed_password = await get_password_hash_async(password_data.new_password)
+    # Revokes every token issued so far, on all devices
+    user.token_version = (user.token_version or 0) + 1
+    await db.commit()
+    invalidate_user(user.username)
+    # New token so this device stays logged in
+    return {"message": "Password updated successfully", "access_token": issue_token(user), "token_type": "bearer"}
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-import shutil
-import os
-import uuid
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
 from models import SiteConfig, User
 from schemas import SiteConfigCreate, SiteConfig as SiteConfigSchema
+from conditional import conditional
 from dependencies import get_current_user
+from uploads import save_upload, public_url
+from media import release_media
+from cache import VersionedCache
 from config import get_settings
 
 settings = get_settings()
@@ -17,36 +19,56 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-@router.get("/", response_model=SiteConfigSchema)
-def get_site_config(db: Session = Depends(get_db)):
-    config = db.query(SiteConfig).first()
+IMAGE_FIELDS = {"bg_image", "memory_bg", "album_bg", "lovelist_bg", "boy_avatar", "girl_avatar"}
+
+# Returned until the config row is first saved
+DEFAULT_SITE_CONFIG = {
+    "id": 0,
+    "boy_name": "Boy",
+    "girl_name": "Girl",
+    "start_date": "2025-01-01T00:00:00",
+    "site_title": "Our Love Story"
+}
+
+# The single config row changes about once a month but is read on every page
+config_cache = VersionedCache("config", ["config"])
+
+async def load_site_config(db):
+    config = await db.scalar(select(SiteConfig).limit(1))
     if not config:
         # Return default if not exists
-        return {
-            "id": 0,
-            "boy_name": "Boy",
-            "girl_name": "Girl",
-            "start_date": "2025-01-01T00:00:00",
-            "site_title": "Our Love Story"
-        }
-    return config
+        return SiteConfigSchema.model_validate(DEFAULT_SITE_CONFIG)
+    return SiteConfigSchema.model_validate(config)
+
+async def cached_site_config(db, versions=None):
+    return await config_cache.get_or_load(db, "config", load_site_config, versions)
+
+@router.get("/", response_model=SiteConfigSchema, dependencies=[Depends(conditional("config"))])
+async def get_site_config(request: Request, db: AsyncSession = Depends(get_db)):
+    return await cached_site_config(db, request.state.versions)
 
 @router.put("/", response_model=SiteConfigSchema)
-def update_site_config(
+async def update_site_config(
     config: SiteConfigCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    db_config = db.query(SiteConfig).first()
+    db_config = await db.scalar(select(SiteConfig).limit(1))
+    replaced = []
     if not db_config:
         db_config = SiteConfig(**config.model_dump())
         db.add(db_config)
     else:
         for key, value in config.model_dump().items():
+            old_value = getattr(db_config, key)
+            if key in IMAGE_FIELDS and old_value != value:
+                replaced.append(old_value)
             setattr(db_config, key, value)
     
-    db.commit()
-    db.refresh(db_config)
+    await db.commit()
+    await db.refresh(db_config)
+    # Backgrounds/avatars that were swapped out
+    await release_media(db, replaced)
     return db_config
 
 @router.post("/upload-avatar")
@@ -54,16 +76,5 @@ async def upload_avatar(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user)
 ):
-    # Generate unique filename
-    extension = os.path.splitext(file.filename)[1]
-    filename = f"avatar_{uuid.uuid4()}{extension}"
-    
-    # Create upload dir
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-    file_path = os.path.join(settings.UPLOAD_DIR, filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    relative_path = f"/static/uploads/{filename}"
-    return {"url": relative_path}
+    stored = await save_upload(file)
+    return {"url": public_url(stored.url)}
@@ -0,0 +1,53 @@
+import asyncio
+import json
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+import events
+
+router = APIRouter(
+    prefix="/api/events",
+    tags=["events"],
+    responses={404: {"description": "Not found"}},
+)
+
+HEARTBEAT_SECONDS = 15
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+# Server-sent events, e.g. new EventSource("/api/events/"). The stream opens with
+#   event: ready   data: {"token": "<latest sync token>"}
+# so the client can catch up with /api/sync?since=<its token>, then sends
+#   event: change  data: {"entity": "album", "id": 12, "op": "upsert"}
+# for every committed write, and
+#   event: resync  data: {}
+# if the client fell too far behind, meaning: sync again and carry on.
+@router.get("/")
+async def stream_events(request: Request):
+    queue = events.hub.subscribe()
+    token = await events.current_token()
+
+    async def generate():
+        try:
+            yield sse("ready", {"token": token})
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comment line keeps proxies and mobile networks from idling us out
+                    yield ": ping\n\n"
+                    continue
+                if event.get("op") == "resync":
+                    yield sse("resync", {})
+                else:
+                    yield sse("change", event)
+        finally:
+            events.hub.unsubscribe(queue)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,63 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import RedirectResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from resize import get_resized, resolve_source, remote_key, MAX_DIMENSION
+from storage import storage
+from delivery import send_file, IMMUTABLE, PRIVATE_IMMUTABLE
+from dependencies import get_media_user
+from config import get_settings
+
+settings = get_settings()
+
+router = APIRouter(
+    prefix="/media",
+    tags=["media"],
+    responses={404: {"description": "Not found"}},
+    # Logged-in users only (Authorization header, or a media token as ?token=)
+    dependencies=[Depends(get_media_user)] if settings.MEDIA_REQUIRE_AUTH else [],
+)
+
+# Legacy files under /media/img/ can be replaced in place
+LEGACY_CACHE = "private, max-age=86400" if settings.MEDIA_REQUIRE_AUTH else "public, max-age=86400"
+UPLOAD_CACHE = PRIVATE_IMMUTABLE if settings.MEDIA_REQUIRE_AUTH else IMMUTABLE
+# Redirects to presigned URLs are cached for half their lifetime
+REDIRECT_CACHE = f"private, max-age={settings.S3_PRESIGN_SECONDS // 2}"
+
+# /media/uploads/<file>                   original bytes, Range requests supported
+# /media/uploads/<file>?w=&h=&fmt=&q=     resized image
+# /media/img/<legacy path>[?...]          the same for the legacy directory
+# These are the only media URLs the API hands out (uploads.public_url), whatever
+# STORAGE_BACKEND is. With object storage, originals are a redirect to a
+# presigned URL (the store handles Range and the transfer); resized images are
+# still served from here.
+@router.api_route("/{path:path}", methods=["GET", "HEAD"])
+async def read_media(
+    request: Request,
+    path: str,
+    w: Optional[int] = Query(None, ge=1, le=MAX_DIMENSION),
+    h: Optional[int] = Query(None, ge=1, le=MAX_DIMENSION),
+    fmt: Optional[str] = None,
+    q: int = Query(80, ge=1, le=100),
+):
+    immutable = path.startswith("uploads/")
+    cache_control = UPLOAD_CACHE if immutable else LEGACY_CACHE
+    if w is None and h is None and fmt is None:
+        key = remote_key(path)
+        if key is not None:
+            if await run_in_threadpool(storage.stat, key) is None:
+                raise HTTPException(status_code=404, detail="Not found")
+            url = await run_in_threadpool(storage.presigned_url, key)
+            return RedirectResponse(url, status_code=307, headers={"Cache-Control": REDIRECT_CACHE})
+        source = await run_in_threadpool(resolve_source, path)
+        etag = None
+        if immutable:
+            # The file name is the content hash
+            etag = '"' + os.path.splitext(os.path.basename(source))[0] + '"'
+        return await send_file(request, source, cache_control, etag=etag)
+
+    cached, content_type = await get_resized(path, w, h, fmt or "webp", q)
+    # The cache key covers the source's mtime and size, so the name pins the content
+    etag = '"' + os.path.splitext(os.path.basename(cached))[0] + '"'
+    return await send_file(request, cached, cache_control, etag=etag, content_type=content_type)
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import date
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db, session_scope
+from models import MemoryDay, Album
+from schemas import Home
+from pagination import fetch_page
+from conditional import conditional
+from routers.config import cached_site_config
+from routers.lovelist import cached_counts
+from cache import TTLCache
+from config import get_settings
+
+settings = get_settings()
+
+router = APIRouter(
+    prefix="/api/home",
+    tags=["home"],
+    responses={404: {"description": "Not found"}},
+)
+
+# Everything the home screen needs in one round trip. Memory days and the album
+# page run concurrently, each in its own session; config and lovelist counts come
+# from their VersionedCaches on the request's session, keyed by the versions the
+# conditional dependency already read. The result is cached per worker and keyed
+# by those versions too, so any write from any worker makes the next request
+# rebuild it.
+home_cache = TTLCache("home", maxsize=4, ttl=settings.HOME_CACHE_SECONDS)
+
+def next_occurrence(day: date, today: date) -> date:
+    if day >= today:
+        # Hasn't happened yet: the first occurrence is the day itself
+        return day
+    for year in (today.year, today.year + 1):
+        try:
+            candidate = day.replace(year=year)
+        except ValueError:
+            # Feb 29 outside a leap year
+            candidate = date(year, 2, 28)
+        if candidate >= today:
+            return candidate
+
+async def load_cached(db, versions):
+    # Usually cache hits; a miss runs on the request's session
+    return await cached_site_config(db, versions), await cached_counts(db, versions)
+
+async def load_anniversaries(today: date):
+    async with session_scope() as db:
+        rows = (await db.execute(
+            select(MemoryDay.id, MemoryDay.title, MemoryDay.icon, MemoryDay.date)
+            .where(MemoryDay.date.is_not(None))
+        )).all()
+    upcoming = []
+    for id, title, icon, day in rows:
+        next_date = next_occurrence(day, today)
+        upcoming.append({
+            "id": id,
+            "title": title or "",
+            "icon": icon,
+            "date": day,
+            "next_date": next_date,
+            "days_left": (next_date - today).days,
+            "years": max(0, next_date.year - day.year),
+        })
+    upcoming.sort(key=lambda item: (item["days_left"], item["id"]))
+    return upcoming[:settings.HOME_ANNIVERSARY_LIMIT]
+
+async def load_albums():
+    async with session_scope() as db:
+        return await fetch_page(db, select(Album), Album.date, Album.id, 0, settings.HOME_ALBUM_LIMIT, None)
+
+@router.get("/", response_model=Home, dependencies=[Depends(conditional("config", "memoryday", "lovelist", "album", daily=True))])
+async def read_home(request: Request, db: AsyncSession = Depends(get_db)):
+    today = date.today()
+    # Read by the conditional dependency; the cached config and counts reuse them
+    versions = request.state.versions
+    version = tuple(versions.values())
+    cached = home_cache.get(today, version)
+    if cached is not None:
+        return cached
+
+    (config, lovelist), anniversaries, (albums, next_cursor) = await asyncio.gather(
+        load_cached(db, versions),
+        load_anniversaries(today),
+        load_albums(),
+    )
+    home = Home(
+        config=config,
+        anniversaries=anniversaries,
+        lovelist=lovelist,
+        albums=albums,
+        album_next_cursor=next_cursor,
+    )
+    home_cache.set(today, home, version)
+    return home
@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request, Response
+from sqlalchemy import select, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from database import get_db
 from models import LoveList, User
-from schemas import LoveList as LoveListSchema, LoveListCreate
+from schemas import LoveList as LoveListSchema, LoveListCreate, LoveListCounts
 from dependencies import get_current_user
+from pagination import paginate
+from conditional import conditional
+from fastjson import json_response
+from uploads import save_upload, public_url
+from media import release_media
+from images import schedule_processing
+from cache import VersionedCache
 
 router = APIRouter(
     prefix="/api/lovelist",
@@ -12,89 +20,112 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-@router.get("/", response_model=List[LoveListSchema])
-def read_lovelist(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    items = db.query(LoveList).order_by(LoveList.created_at.desc()).offset(skip).limit(limit).all()
-    return items
+@router.get("/", response_model=List[LoveListSchema], dependencies=[Depends(conditional("lovelist"))])
+async def read_lovelist(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    items = await paginate(db, select(LoveList), LoveList.created_at, LoveList.id, response, skip, limit, cursor)
+    return json_response(items, List[LoveListSchema], response)
+
+counts_cache = VersionedCache("lovelist_counts", ["lovelist"])
+
+async def load_counts(db):
+    total, completed = (await db.execute(
+        select(func.count(LoveList.id), func.sum(case((LoveList.is_completed.is_(True), 1), else_=0)))
+    )).one()
+    return LoveListCounts(total=total or 0, completed=int(completed or 0))
+
+async def cached_counts(db, versions=None):
+    return await counts_cache.get_or_load(db, "counts", load_counts, versions)
+
+@router.get("/counts", response_model=LoveListCounts, dependencies=[Depends(conditional("lovelist"))])
+async def read_lovelist_counts(request: Request, db: AsyncSession = Depends(get_db)):
+    return await cached_counts(db, request.state.versions)
 
 @router.post("/", response_model=LoveListSchema)
-def create_lovelist_item(
+async def create_lovelist_item(
     item: LoveListCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     db_item = LoveList(**item.model_dump())
     db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    await db.commit()
+    await db.refresh(db_item)
+    if db_item.image_url:
+        await schedule_processing(db, LoveList, db_item.id)
     return db_item
 
 @router.put("/{item_id}", response_model=LoveListSchema)
-def update_lovelist_item(
+async def update_lovelist_item(
     item_id: int,
     item: LoveListCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    db_item = db.query(LoveList).filter(LoveList.id == item_id).first()
+    db_item = await db.get(LoveList, item_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Item not found")
     
+    old_image_url = db_item.image_url
     for key, value in item.model_dump().items():
         setattr(db_item, key, value)
+    if old_image_url != db_item.image_url:
+        # Derived image data belongs to the old photo
+        db_item.image_width = db_item.image_height = db_item.image_placeholder = None
         
-    db.commit()
-    db.refresh(db_item)
+    await db.commit()
+    await db.refresh(db_item)
+    if old_image_url != db_item.image_url:
+        await release_media(db, [old_image_url])
+        await schedule_processing(db, LoveList, item_id)
     return db_item
 
 @router.delete("/{item_id}")
-def delete_lovelist_item(
+async def delete_lovelist_item(
     item_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    db_item = db.query(LoveList).filter(LoveList.id == item_id).first()
+    db_item = await db.get(LoveList, item_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Item not found")
         
-    db.delete(db_item)
-    db.commit()
+    image_url = db_item.image_url
+    await db.delete(db_item)
+    await db.commit()
+    await release_media(db, [image_url])
     return {"ok": True}
 
 @router.post("/{item_id}/photo")
 async def upload_lovelist_photo(
     item_id: int,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    import os
-    import shutil
-    import uuid
-    from models import LoveList
-    from config import get_settings
-    
-    settings = get_settings()
-    
-    db_item = db.query(LoveList).filter(LoveList.id == item_id).first()
+    db_item = await db.get(LoveList, item_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    # Generate unique filename
-    extension = os.path.splitext(file.filename)[1]
-    filename = f"lovelist_{uuid.uuid4()}{extension}"
-    
-    # Create upload dir if not exists
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-    file_path = os.path.join(settings.UPLOAD_DIR, filename)
+    stored = await save_upload(file)
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Save relative path to DB
-    relative_path = f"/static/uploads/{filename}"
+    # Save relative path to DB, releasing the photo it replaces
+    old_image_url = db_item.image_url
+    relative_path = stored.url
     db_item.image_url = relative_path
-    db.commit()
-    db.refresh(db_item)
+    if old_image_url != relative_path:
+        db_item.image_width = db_item.image_height = db_item.image_placeholder = None
+    await db.commit()
+    await db.refresh(db_item)
+    if old_image_url != relative_path:
+        await release_media(db, [old_image_url])
+    
+    # Size and placeholder are computed by a background job
+    await schedule_processing(db, LoveList, item_id)
     
-    return {"url": relative_path}
+    return {"url": public_url(relative_path)}
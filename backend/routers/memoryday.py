@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from typing import List
-import shutil
-import os
-import uuid
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from database import get_db
 from models import MemoryDay, MemoryDayPhoto, User
 from schemas import MemoryDay as MemoryDaySchema, MemoryDayCreate
 from dependencies import get_current_user
+from pagination import paginate
+from conditional import conditional
+from fastjson import json_response
+from uploads import save_upload, public_url, MEDIA
+from media import release_media
+from images import schedule_processing
 from config import get_settings
 
 settings = get_settings()
@@ -18,108 +22,103 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-@router.get("/", response_model=List[MemoryDaySchema])
-def read_memory_days(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    items = db.query(MemoryDay).order_by(MemoryDay.date.desc()).offset(skip).limit(limit).all()
-    return items
+@router.get("/", response_model=List[MemoryDaySchema], dependencies=[Depends(conditional("memoryday"))])
+async def read_memory_days(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    items = await paginate(db, select(MemoryDay), MemoryDay.date, MemoryDay.id, response, skip, limit, cursor)
+    return json_response(items, List[MemoryDaySchema], response)
 
 @router.post("/", response_model=MemoryDaySchema)
-def create_memory_day(
+async def create_memory_day(
     item: MemoryDayCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     db_item = MemoryDay(**item.model_dump())
     db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    await db.commit()
+    await db.refresh(db_item)
     return db_item
 
 @router.put("/{item_id}", response_model=MemoryDaySchema)
-def update_memory_day(
+async def update_memory_day(
     item_id: int,
     item: MemoryDayCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    db_item = db.query(MemoryDay).filter(MemoryDay.id == item_id).first()
+    db_item = await db.get(MemoryDay, item_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Item not found")
     
     for key, value in item.model_dump().items():
         setattr(db_item, key, value)
         
-    db.commit()
-    db.refresh(db_item)
+    await db.commit()
+    await db.refresh(db_item)
     return db_item
 
 @router.delete("/{item_id}")
-def delete_memory_day(
+async def delete_memory_day(
     item_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    db_item = db.query(MemoryDay).filter(MemoryDay.id == item_id).first()
+    db_item = await db.get(MemoryDay, item_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Item not found")
         
-    db.delete(db_item)
-    db.commit()
+    photo_urls = [photo.url for photo in db_item.photos]
+    await db.delete(db_item)
+    await db.commit()
+    await release_media(db, photo_urls)
     return {"ok": True}
 
 @router.post("/{item_id}/photo")
 async def upload_memory_day_photo(
     item_id: int,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    db_item = db.query(MemoryDay).filter(MemoryDay.id == item_id).first()
-    if not db_item:
+    if await db.scalar(select(MemoryDay.id).where(MemoryDay.id == item_id)) is None:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    # Generate unique filename
-    extension = os.path.splitext(file.filename)[1]
-    filename = f"{uuid.uuid4()}{extension}"
-    
-    # Create upload dir if not exists
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-    file_path = os.path.join(settings.UPLOAD_DIR, filename)
+    stored = await save_upload(file, kinds=MEDIA)
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Save relative path to DB (a retried upload of the same file reuses its row)
+    relative_path = stored.url
+    db_photo = await db.scalar(
+        select(MemoryDayPhoto).where(MemoryDayPhoto.memory_day_id == item_id, MemoryDayPhoto.url == relative_path)
+    )
+    if db_photo is None:
+        db_photo = MemoryDayPhoto(memory_day_id=item_id, url=relative_path)
+        db.add(db_photo)
+        await db.commit()
+        await db.refresh(db_photo)
     
-    # Save relative path to DB
-    relative_path = f"/static/uploads/{filename}"
-    db_photo = MemoryDayPhoto(memory_day_id=item_id, url=relative_path)
-    db.add(db_photo)
-    db.commit()
-    db.refresh(db_photo)
-    
-    return {"url": relative_path, "id": db_photo.id}
+    # Thumbnails, size and placeholder are computed by a background job
+    await schedule_processing(db, MemoryDayPhoto, db_photo.id)
+    return {"url": public_url(relative_path), "id": db_photo.id}
 
 @router.delete("/photo/{photo_id}")
-def delete_memory_day_photo(
+async def delete_memory_day_photo(
     photo_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    db_photo = db.query(MemoryDayPhoto).filter(MemoryDayPhoto.id == photo_id).first()
+    db_photo = await db.get(MemoryDayPhoto, photo_id)
     if not db_photo:
         raise HTTPException(status_code=404, detail="Photo not found")
     
-    # Optional: Delete file from disk
-    # This requires careful handling (e.g. check if used elsewhere, though here it's 1:1)
-    if db_photo.url.startswith("/static/uploads/"):
-         # Construct absolute path
-         filename = os.path.basename(db_photo.url)
-         file_path = os.path.join(settings.UPLOAD_DIR, filename)
-         if os.path.exists(file_path):
-             try:
-                 os.remove(file_path)
-             except Exception as e:
-                 print(f"Error deleting file: {e}")
-
-    db.delete(db_photo)
-    db.commit()
+    url = db_photo.url
+    await db.delete(db_photo)
+    await db.commit()
+    # Delete file from disk unless another row (album, lovelist, config) still uses it
+    await release_media(db, [url])
     return {"ok": True}
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+from models import User
+from dependencies import get_current_user
+from cache import CACHES
+
+router = APIRouter(
+    prefix="/api/stats",
+    tags=["stats"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("/caches")
+async def read_cache_stats(current_user: User = Depends(get_current_user)):
+    # Counters are per worker process
+    return {name: cache.stats() for name, cache in CACHES.items()}
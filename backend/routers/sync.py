@@ -0,0 +1,85 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from database import get_db
+from models import SiteConfig, MemoryDay, Album, LoveList, ChangeLog
+from schemas import SyncResponse
+from conditional import conditional
+from fastjson import json_response
+from changes import DELETE
+from changelog import ChangeCursor, advance_cursor, current_cursor, pruned_before
+
+router = APIRouter(
+    prefix="/api/sync",
+    tags=["sync"],
+    responses={404: {"description": "Not found"}},
+)
+
+MODELS = {
+    "album": Album,
+    "memoryday": MemoryDay,
+    "lovelist": LoveList,
+    "config": SiteConfig,
+}
+
+# The token is a ChangeCursor (changelog.py): the last change_log id read, plus
+# any lower ids that were still uncommitted at the time
+
+def parse_token(since: Optional[str]) -> ChangeCursor:
+    if not since:
+        return ChangeCursor()
+    try:
+        return ChangeCursor.parse(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
+@router.get("/", response_model=SyncResponse, dependencies=[Depends(conditional(*MODELS))])
+async def sync(response: Response, since: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    cursor = parse_token(since)
+    latest = await db.scalar(select(func.max(ChangeLog.id))) or 0
+
+    body = {"full": False, "deleted": {}}
+
+    if cursor.last_id <= 0 or cursor.last_id > latest or cursor.last_id < await pruned_before(db, latest):
+        # First sync, a token from another database, or one older than the
+        # pruned change_log: full snapshot
+        body["token"] = str(await current_cursor(db, latest))
+        body["full"] = True
+        for entity, model in MODELS.items():
+            items = (await db.scalars(select(model).order_by(model.id))).all()
+            if entity == "config":
+                body["config"] = items[0] if items else None
+            else:
+                body[entity] = items
+        return json_response(body, SyncResponse, response)
+
+    # Last op per entity wins
+    ops = {}
+    seen = []
+    log = await db.execute(
+        select(ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op)
+        .where(cursor.where(), ChangeLog.id <= latest)
+        .order_by(ChangeLog.id)
+    )
+    for change_id, entity, entity_id, op in log:
+        seen.append(change_id)
+        ops[(entity, entity_id)] = op
+    body["token"] = str(await advance_cursor(db, cursor, seen, latest))
+
+    for entity, model in MODELS.items():
+        upserts = [i for (e, i), op in ops.items() if e == entity and op != DELETE]
+        deleted = [i for (e, i), op in ops.items() if e == entity and op == DELETE]
+        items = []
+        if upserts:
+            items = (await db.scalars(select(model).where(model.id.in_(upserts)).order_by(model.id))).all()
+            # Logged as changed but gone by now: report as deleted
+            found = {item.id for item in items}
+            deleted += [i for i in upserts if i not in found]
+        if entity == "config":
+            body["config"] = items[0] if items else None
+        else:
+            body[entity] = items
+        body["deleted"][entity] = sorted(deleted)
+
+    return json_response(body, SyncResponse, response)
@@ -1,6 +1,12 @@
 from datetime import date, datetime
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import Annotated, List, Optional
+from pydantic import BaseModel, BeforeValidator, PlainSerializer
+from uploads import public_url, stored_url
+
+# Media URLs: stored as /static/uploads/<key>, sent to clients as /media/uploads/<key>.
+# Client input in either form is stored in the first; model_dump() (python mode)
+# keeps the stored form, only JSON output is rewritten.
+MediaURL = Annotated[str, BeforeValidator(stored_url), PlainSerializer(public_url, when_used="json")]
 
 # User Schemas
 class UserBase(BaseModel):
@@ -33,12 +39,12 @@ class SiteConfigBase(BaseModel):
     boy_name: str
     girl_name: str
     start_date: datetime
-    bg_image: Optional[str] = None
-    memory_bg: Optional[str] = None
-    album_bg: Optional[str] = None
-    lovelist_bg: Optional[str] = None
-    boy_avatar: Optional[str] = None
-    girl_avatar: Optional[str] = None
+    bg_image: Optional[MediaURL] = None
+    memory_bg: Optional[MediaURL] = None
+    album_bg: Optional[MediaURL] = None
+    lovelist_bg: Optional[MediaURL] = None
+    boy_avatar: Optional[MediaURL] = None
+    girl_avatar: Optional[MediaURL] = None
     site_title: str
 
 class SiteConfigCreate(SiteConfigBase):
@@ -50,13 +56,25 @@ class SiteConfig(SiteConfigBase):
     class Config:
         from_attributes = True
 
+# Resized copies of an uploaded photo, smallest first
+class PhotoVariant(BaseModel):
+    width: int
+    height: int
+    url: MediaURL
+
 # Memory Day Schemas
 class MemoryDayPhotoBase(BaseModel):
-    url: str
+    url: MediaURL
 
 class MemoryDayPhoto(MemoryDayPhotoBase):
     id: int
     memory_day_id: int
+    variants: Optional[List[PhotoVariant]] = None # None until generated (videos never get any)
+    width: Optional[int] = None
+    height: Optional[int] = None
+    placeholder: Optional[str] = None # tiny base64 data URI to show while loading
+    poster: Optional[MediaURL] = None # videos: still frame for the grid
+    duration: Optional[float] = None # videos: seconds
     
     class Config:
         from_attributes = True
@@ -80,11 +98,17 @@ class MemoryDay(MemoryDayBase):
 
 # Album Schemas
 class AlbumPhotoBase(BaseModel):
-    url: str
+    url: MediaURL
 
 class AlbumPhoto(AlbumPhotoBase):
     id: int
     album_id: int
+    variants: Optional[List[PhotoVariant]] = None # None until generated (videos never get any)
+    width: Optional[int] = None
+    height: Optional[int] = None
+    placeholder: Optional[str] = None # tiny base64 data URI to show while loading
+    poster: Optional[MediaURL] = None # videos: still frame for the grid
+    duration: Optional[float] = None # videos: seconds
     
     class Config:
         from_attributes = True
@@ -94,7 +118,7 @@ class AlbumBase(BaseModel):
     date: date
 
 class AlbumCreate(AlbumBase):
-    photos: List[str] = [] # URLs
+    photos: List[MediaURL] = [] # URLs
 
 class AlbumCommentBase(BaseModel):
     content: str
@@ -120,11 +144,33 @@ class Album(AlbumBase):
     class Config:
         from_attributes = True
 
+# Grid view: the first photo stands in for the album
+class AlbumSummary(AlbumBase):
+    id: int
+    created_at: datetime
+    cover: Optional[AlbumPhoto] = None
+    photo_count: int = 0
+    comment_count: int = 0
+
+# Resumable Upload Schemas
+class UploadSessionCreate(BaseModel):
+    album_id: int
+    filename: str
+    size: int # Total bytes
+
+class UploadSession(UploadSessionCreate):
+    id: str
+    chunk_size: int
+    received: int # Bytes stored so far; the next chunk index is received // chunk_size
+    
+    class Config:
+        from_attributes = True
+
 # Love List Schemas
 class LoveListBase(BaseModel):
     title: str
     is_completed: bool = False
-    image_url: Optional[str] = None
+    image_url: Optional[MediaURL] = None
 
 class LoveListCreate(LoveListBase):
     pass
@@ -132,6 +178,46 @@ class LoveListCreate(LoveListBase):
 class LoveList(LoveListBase):
     id: int
     created_at: datetime
+    image_width: Optional[int] = None
+    image_height: Optional[int] = None
+    image_placeholder: Optional[str] = None
     
     class Config:
         from_attributes = True
+
+# Delta Sync Schemas
+class SyncDeleted(BaseModel):
+    album: List[int] = []
+    memoryday: List[int] = []
+    lovelist: List[int] = []
+    config: List[int] = []
+
+class SyncResponse(BaseModel):
+    token: str # pass back as ?since= on the next sync
+    full: bool # True: a complete snapshot, replace the local cache instead of merging
+    config: Optional[SiteConfig] = None
+    album: List[Album] = []
+    memoryday: List[MemoryDay] = []
+    lovelist: List[LoveList] = []
+    deleted: SyncDeleted = SyncDeleted()
+
+# Home Screen Schemas
+class UpcomingAnniversary(BaseModel):
+    id: int
+    title: str
+    icon: Optional[str] = None
+    date: date
+    next_date: date
+    days_left: int
+    years: int # how many years next_date marks
+
+class LoveListCounts(BaseModel):
+    total: int
+    completed: int
+
+class Home(BaseModel):
+    config: SiteConfig
+    anniversaries: List[UpcomingAnniversary] = []
+    lovelist: LoveListCounts
+    albums: List[Album] = []
+    album_next_cursor: Optional[str] = None # pass as ?cursor= to /api/album/
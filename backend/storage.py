@@ -0,0 +1,355 @@
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Iterator, Optional
+from config import get_settings
+
+settings = get_settings()
+
+# Where uploaded files live. Everything above this module deals in keys (the file
+# name, e.g. "<sha256>.jpg"). Rows store /static/uploads/<key> whatever the
+# backend, so switching backends never rewrites rows; clients only ever see
+# /media/uploads/<key> (schemas.MediaURL), which routers/files.py serves from
+# disk or redirects to a presigned URL, so the same URL works on every backend.
+#
+#   LocalStorage  files in UPLOAD_DIR (the default)
+#   S3Storage     any S3-compatible bucket (AWS S3, MinIO, R2...), so app servers
+#                 can scale out without sharing a disk. boto3 is only needed here.
+#
+# All methods block: call them through run_in_threadpool from async code. Large
+# files never sit in memory: puts and gets stream (boto3 switches to multipart
+# above S3_MULTIPART_MB), and resumable uploads map onto a native multipart
+# upload, one part per chunk, so chunks may land on different app servers.
+#
+# Tests: tests/test_storage.py runs every backend (moto, and a MinIO when
+# TEST_S3_ENDPOINT_URL is set).
+
+CHUNK_SIZE = 1024 * 1024
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/heic", ".heic")
+
+def guess_content_type(key: str) -> str:
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+@dataclass
+class StoredObject:
+    key: str
+    size: int
+    mtime: float
+
+class LocalStorage:
+    name = "local"
+    is_local = True
+
+    def __init__(self, root: str):
+        self.root = root
+        # Same filesystem as the files, so publishing is an atomic rename
+        self.tmp_dir = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            st = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        return StoredObject(key, st.st_size, st.st_mtime)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def put_file(self, src: str, key: str, content_type: Optional[str] = None):
+        # Takes ownership of src
+        dest = self.path(key)
+        if os.path.realpath(src) == os.path.realpath(dest):
+            return
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(src, dest)
+
+    def get(self, key: str, start: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+        with open(self.path(key), "rb") as f:
+            f.seek(start)
+            remaining = length
+            while remaining is None or remaining > 0:
+                data = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                if remaining is not None:
+                    remaining -= len(data)
+                yield data
+
+    def fetch(self, key: str) -> str:
+        # Local path to read the file from (Pillow, ffmpeg); hand it back to release()
+        path = self.path(key)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(key)
+        return path
+
+    def release(self, path: str):
+        pass
+
+    def move(self, src_key: str, dest_key: str):
+        os.replace(self.path(src_key), self.path(dest_key))
+
+    def touch(self, key: str):
+        os.utime(self.path(key))
+
+    def delete(self, key: str) -> bool:
+        try:
+            os.remove(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    def list(self) -> Iterator[StoredObject]:
+        # Streams the directory; hidden names (in-flight and resumable files) are skipped
+        if not os.path.isdir(self.root):
+            return
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                yield StoredObject(entry.name, st.st_size, st.st_mtime)
+
+    def presigned_url(self, key: str, expires: int = None) -> Optional[str]:
+        # Served by /media (or nginx) instead
+        return None
+
+    # Multipart: parts are written in place at their offset
+
+    def create_multipart(self, key: str) -> Optional[str]:
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        return None
+
+    def upload_part(self, key: str, token: Optional[str], index: int, offset: int, fileobj, size: int):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            # Drop whatever a failed attempt left past the last acknowledged part
+            f.truncate(offset)
+            f.seek(offset)
+            shutil.copyfileobj(fileobj, f, CHUNK_SIZE)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def complete_multipart(self, key: str, token: Optional[str]):
+        pass
+
+    def abort_multipart(self, key: str, token: Optional[str]):
+        self.delete(key)
+
+class S3Storage:
+    name = "s3"
+    is_local = False
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, region: str = None,
+                 access_key: str = None, secret_key: str = None, multipart_mb: int = 16, tmp_dir: str = None):
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.multipart_bytes = multipart_mb * 1024 * 1024
+        self.tmp_dir = tmp_dir or tempfile.gettempdir()
+        self._client = None
+        self._transfer = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Created on first use (boto3 clients are thread-safe)
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    try:
+                        import boto3
+                        from boto3.s3.transfer import TransferConfig
+                        from botocore.config import Config
+                    except ImportError:
+                        raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 (pip install boto3)")
+                    self._transfer = TransferConfig(
+                        multipart_threshold=self.multipart_bytes,
+                        multipart_chunksize=self.multipart_bytes,
+                    )
+                    self._client = boto3.client(
+                        "s3",
+                        endpoint_url=self.endpoint_url,
+                        region_name=self.region,
+                        aws_access_key_id=self.access_key,
+                        aws_secret_access_key=self.secret_key,
+                        # Path-style addressing: MinIO and most self-hosted stores need it
+                        config=Config(signature_version="s3v4", s3={"addressing_style": "path"}),
+                    )
+        return self._client
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    @staticmethod
+    def _missing(error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound", "NoSuchUpload")
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+        return StoredObject(key, head["ContentLength"], head["LastModified"].timestamp())
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def put_file(self, src: str, key: str, content_type: Optional[str] = None):
+        # Takes ownership of src; multipart above S3_MULTIPART_MB
+        self.client.upload_file(
+            src, self.bucket, self._key(key),
+            ExtraArgs={"ContentType": content_type or guess_content_type(key)},
+            Config=self._transfer,
+        )
+        os.remove(src)
+
+    def get(self, key: str, start: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if start or length is not None:
+            end = "" if length is None else start + length - 1
+            params["Range"] = f"bytes={start}-{end}"
+        body = self.client.get_object(**params)["Body"]
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def fetch(self, key: str) -> str:
+        # Downloads into a private temp dir, so files written next to it (variants,
+        # posters) can be uploaded from there; release() removes the lot
+        directory = tempfile.mkdtemp(dir=self.tmp_dir)
+        path = os.path.join(directory, key)
+        try:
+            self.client.download_file(self.bucket, self._key(key), path, Config=self._transfer)
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return path
+
+    def release(self, path: str):
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    def move(self, src_key: str, dest_key: str):
+        # Server-side copy (multipart for large objects), then drop the source
+        self.client.copy(
+            {"Bucket": self.bucket, "Key": self._key(src_key)}, self.bucket, self._key(dest_key),
+            ExtraArgs={"ContentType": guess_content_type(dest_key), "MetadataDirective": "REPLACE"},
+            Config=self._transfer,
+        )
+        self.delete(src_key)
+
+    def touch(self, key: str):
+        # Objects are immutable; an in-place copy is the only way to refresh LastModified
+        self.client.copy_object(
+            Bucket=self.bucket, Key=self._key(key),
+            CopySource={"Bucket": self.bucket, "Key": self._key(key)},
+            ContentType=guess_content_type(key), MetadataDirective="REPLACE",
+        )
+
+    def delete(self, key: str) -> bool:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        return True
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": self._key(key)} for key in keys[i:i + 1000]], "Quiet": True},
+            )
+
+    def list(self) -> Iterator[StoredObject]:
+        # One page (1000 keys) at a time; resumable parts under .sessions/ are skipped
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                key = item["Key"][len(self.prefix):]
+                if not key or key.startswith(".") or "/" in key:
+                    continue
+                yield StoredObject(key, item["Size"], item["LastModified"].timestamp())
+
+    def presigned_url(self, key: str, expires: int = None) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key)},
+            ExpiresIn=expires or settings.S3_PRESIGN_SECONDS,
+        )
+
+    # Multipart: part n + 1 holds chunk n. Every part but the last must be at
+    # least 5 MB, which RESUMABLE_CHUNK_MB (8) satisfies.
+
+    def create_multipart(self, key: str) -> str:
+        upload = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=self._key(key), ContentType=guess_content_type(key)
+        )
+        return upload["UploadId"]
+
+    def upload_part(self, key: str, token: str, index: int, offset: int, fileobj, size: int):
+        # A retried chunk replaces its part
+        self.client.upload_part(
+            Bucket=self.bucket, Key=self._key(key), UploadId=token,
+            PartNumber=index + 1, Body=fileobj, ContentLength=size,
+        )
+
+    def complete_multipart(self, key: str, token: str):
+        parts = []
+        paginator = self.client.get_paginator("list_parts")
+        for page in paginator.paginate(Bucket=self.bucket, Key=self._key(key), UploadId=token):
+            parts.extend({"PartNumber": part["PartNumber"], "ETag": part["ETag"]} for part in page.get("Parts", []))
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self._key(key), UploadId=token,
+            MultipartUpload={"Parts": sorted(parts, key=lambda part: part["PartNumber"])},
+        )
+
+    def abort_multipart(self, key: str, token: Optional[str]):
+        from botocore.exceptions import ClientError
+        if token:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(key), UploadId=token)
+            except ClientError as e:
+                # Already completed or aborted
+                if not self._missing(e):
+                    raise
+        self.delete(key)
+
+def create_storage():
+    if settings.STORAGE_BACKEND == "local":
+        return LocalStorage(settings.UPLOAD_DIR)
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Storage(
+            settings.S3_BUCKET,
+            prefix=settings.S3_PREFIX,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region=settings.S3_REGION,
+            access_key=settings.S3_ACCESS_KEY,
+            secret_key=settings.S3_SECRET_KEY,
+            multipart_mb=settings.S3_MULTIPART_MB,
+            tmp_dir=settings.STORAGE_TMP_DIR,
+        )
+    raise RuntimeError(f"Unknown STORAGE_BACKEND {settings.STORAGE_BACKEND!r}")
+
+storage = create_storage()
@@ -0,0 +1,88 @@
+import os
+import tempfile
+
+# Settings are read once, at import: point everything at a throwaway SQLite
+# database and temp dirs before any app module is loaded.
+# pip install -r requirements-dev.txt && python -m pytest
+_tmp = tempfile.mkdtemp(prefix="qlxz-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_tmp}/test.db",
+    "ASYNC_DATABASE_URL": f"sqlite+aiosqlite:///{_tmp}/test.db",
+    # ThreadedSession on the sync engine: one engine to count statements on
+    "DB_ASYNC": "false",
+    "UPLOAD_DIR": os.path.join(_tmp, "uploads"),
+    "MEDIA_CACHE_DIR": os.path.join(_tmp, "cache"),
+    "STORAGE_BACKEND": "local",
+    "BCRYPT_ROUNDS": "4",
+})
+
+import pytest
+from sqlalchemy import BigInteger, event
+from sqlalchemy.ext.compiler import compiles
+
+@compiles(BigInteger, "sqlite")
+def _sqlite_bigint(type_, compiler, **kw):
+    # SQLite only autoincrements INTEGER PRIMARY KEY columns
+    return "INTEGER"
+
+from database import Base, SessionLocal, engine
+import models # registers the tables
+import changes # change_log flush hook
+
+class StatementCounter:
+    # before_cursor_execute listener: every statement sent to the database
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def reset(self):
+        self.statements.clear()
+
+@pytest.fixture
+def statements():
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    yield counter
+    event.remove(engine, "before_cursor_execute", counter)
+
+@pytest.fixture
+def tables():
+    # Fresh, empty tables for each test
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture
+def db(tables):
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def app(tables):
+    from main import app
+    from cache import CACHES
+    for cache in CACHES.values():
+        cache.invalidate()
+    return app
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+    # Not entered as a context manager: startup hooks (job runner, event broker) stay off
+    return TestClient(app)
+
+@pytest.fixture
+def auth(client):
+    client.post("/api/auth/register", json={"username": "alice", "password": "secret"})
+    response = client.post("/api/auth/login", data={"username": "alice", "password": "secret"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,31 @@
+from sqlalchemy import update
+from models import User
+import dependencies
+
+def test_cached_user_is_revoked_by_a_password_change_elsewhere(client, auth, db, monkeypatch):
+    assert client.get("/api/stats/caches", headers=auth).status_code == 200 # now cached
+
+    # Another worker changes the password: this worker's cache is not invalidated
+    db.execute(update(User).where(User.username == "alice").values(token_version=User.token_version + 1))
+    db.commit()
+
+    # Still trusted within USER_REVALIDATE_SECONDS, re-checked after it
+    assert client.get("/api/stats/caches", headers=auth).status_code == 200
+    monkeypatch.setattr(dependencies.settings, "USER_REVALIDATE_SECONDS", 0)
+    assert client.get("/api/stats/caches", headers=auth).status_code == 401
+
+def test_cached_user_costs_no_queries(client, auth, statements):
+    assert client.get("/api/stats/caches", headers=auth).status_code == 200 # now cached
+    statements.reset()
+    assert client.get("/api/stats/caches", headers=auth).status_code == 200
+    assert statements.count == 0, statements.statements
+
+def test_change_password_issues_a_working_token(client, auth):
+    response = client.post(
+        "/api/auth/change-password", headers=auth,
+        json={"old_password": "secret", "new_password": "secret2"},
+    )
+    assert response.status_code == 200
+    assert client.get("/api/stats/caches", headers=auth).status_code == 401
+    fresh = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/api/stats/caches", headers=fresh).status_code == 200
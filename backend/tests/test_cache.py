@@ -0,0 +1,28 @@
+import asyncio
+from sqlalchemy import delete
+from database import session_scope
+from models import LoveList, ChangeLog
+from routers.lovelist import cached_counts
+
+def add_item(db, title, change_id):
+    item = LoveList(title=title)
+    db.add(item)
+    db.commit()
+    # Rewrite its change_log row to a chosen id, as if allocated earlier
+    db.execute(delete(ChangeLog).where(ChangeLog.entity_id == item.id))
+    db.add(ChangeLog(id=change_id, entity="lovelist", entity_id=item.id, op="upsert"))
+    db.commit()
+
+async def counts():
+    async with session_scope() as db:
+        return await cached_counts(db)
+
+def test_late_commit_reloads_cached_counts(app, client, db):
+    add_item(db, "later", change_id=5)
+    assert asyncio.run(counts()).total == 1
+    assert client.get("/api/lovelist/counts").json()["total"] == 1
+
+    # Id 4 commits after 5: the newest id stays the same
+    add_item(db, "earlier", change_id=4)
+    assert asyncio.run(counts()).total == 2
+    assert client.get("/api/lovelist/counts").json()["total"] == 2
@@ -0,0 +1,24 @@
+from datetime import date
+from sqlalchemy import delete
+from models import Album, ChangeLog
+
+def add_album(db, description, change_id):
+    album = Album(description=description, date=date(2024, 5, 1))
+    db.add(album)
+    db.commit()
+    # Rewrite its change_log row to a chosen id, as if allocated earlier
+    db.execute(delete(ChangeLog).where(ChangeLog.entity_id == album.id))
+    db.add(ChangeLog(id=change_id, entity="album", entity_id=album.id, op="upsert"))
+    db.commit()
+
+def test_late_commit_changes_the_etag(client, db):
+    add_album(db, "second", change_id=5)
+    first = client.get("/api/album/")
+    etag = first.headers["etag"]
+    assert client.get("/api/album/", headers={"If-None-Match": etag}).status_code == 304
+
+    # Id 4 was allocated before 5 but commits after it: the newest id stays 5
+    add_album(db, "first", change_id=4)
+    response = client.get("/api/album/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.json()) == 2
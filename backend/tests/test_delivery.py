@@ -0,0 +1,79 @@
+import os
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from delivery import file_response, parse_range, RangeNotSatisfiable, IMMUTABLE
+
+DATA = bytes(range(256)) * 4 # 1024 bytes
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / "a.bin").write_bytes(DATA)
+    (tmp_path / "empty.bin").write_bytes(b"")
+    app = FastAPI()
+
+    @app.get("/{name}")
+    async def serve(name: str, request: Request):
+        return await file_response(request, os.path.join(tmp_path, name), IMMUTABLE)
+
+    return TestClient(app)
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=10-19", 100) == (10, 19)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    assert parse_range("bytes=20-10", 100) is None
+    assert parse_range("bytes=0-1,5-6", 100) is None # multiple ranges: whole file
+    for header, size in [("bytes=100-", 100), ("bytes=-0", 100), ("bytes=-5", 0), ("bytes=0-", 0)]:
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range(header, size)
+
+def test_whole_file(files):
+    response = files.get("/a.bin")
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(len(DATA))
+
+def test_partial_content(files):
+    response = files.get("/a.bin", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == DATA[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(DATA)}"
+    assert response.headers["content-length"] == "100"
+
+    response = files.get("/a.bin", headers={"Range": "bytes=-24"})
+    assert response.status_code == 206
+    assert response.content == DATA[-24:]
+
+def test_range_not_satisfiable(files):
+    response = files.get("/a.bin", headers={"Range": f"bytes={len(DATA)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(DATA)}"
+
+    response = files.get("/empty.bin", headers={"Range": "bytes=-10"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */0"
+    assert files.get("/empty.bin").status_code == 200
+
+def test_if_range(files):
+    etag = files.get("/a.bin").headers["etag"]
+    response = files.get("/a.bin", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == DATA[:10]
+
+    # The client's copy is stale: send the whole file instead
+    response = files.get("/a.bin", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+def test_not_modified(files):
+    etag = files.get("/a.bin").headers["etag"]
+    for if_none_match in [etag, f'"other", W/{etag}', "*"]:
+        response = files.get("/a.bin", headers={"If-None-Match": if_none_match})
+        assert response.status_code == 304, if_none_match
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+    assert files.get("/a.bin", headers={"If-None-Match": '"other"'}).status_code == 200
@@ -0,0 +1,32 @@
+import asyncio
+from models import ChangeLog
+import events
+
+def add_change(db, change_id, entity_id):
+    db.add(ChangeLog(id=change_id, entity="album", entity_id=entity_id, op="upsert"))
+    db.commit()
+
+def poll(broker, queue):
+    asyncio.run(broker.poll_once())
+    received = []
+    while not queue.empty():
+        received.append(queue.get_nowait()["id"])
+    return received
+
+def test_changelog_broker_catches_up_on_late_commits(db):
+    hub = events.Hub(queue_size=16)
+    queue = hub.subscribe()
+    broker = events.ChangeLogBroker(hub, interval=1)
+
+    add_change(db, 1, entity_id=10)
+    assert poll(broker, queue) == [10]
+
+    # 2 is still in flight when 3 commits
+    add_change(db, 3, entity_id=30)
+    assert poll(broker, queue) == [30]
+    assert set(broker.cursor.missing) == {2}
+
+    add_change(db, 2, entity_id=20)
+    assert poll(broker, queue) == [20]
+    assert broker.cursor.missing == {}
+    assert poll(broker, queue) == []
@@ -0,0 +1,28 @@
+from datetime import date, timedelta
+from models import MemoryDay
+from routers.home import next_occurrence
+
+def test_next_occurrence():
+    today = date(2026, 10, 18)
+    assert next_occurrence(date(2020, 12, 1), today) == date(2026, 12, 1)
+    assert next_occurrence(date(2020, 1, 1), today) == date(2027, 1, 1)
+    assert next_occurrence(date(2030, 1, 1), today) == date(2030, 1, 1) # first one still ahead
+    assert next_occurrence(date(2024, 2, 29), date(2027, 3, 1)) == date(2028, 2, 29)
+
+def test_home_lists_future_memory_days(client, db, statements):
+    today = date.today()
+    db.add_all([
+        MemoryDay(title="met", date=today - timedelta(days=400)),
+        MemoryDay(title="wedding", date=today + timedelta(days=3)),
+    ])
+    db.commit()
+
+    statements.reset()
+    response = client.get("/api/home/")
+    assert response.status_code == 200
+    anniversaries = {a["title"]: a for a in response.json()["anniversaries"]}
+    assert anniversaries["wedding"]["days_left"] == 3
+    assert anniversaries["wedding"]["years"] == 0
+    assert anniversaries["met"]["years"] >= 1
+    # Versions, config, memory days, lovelist counts, albums
+    assert statements.count == 5, statements.statements
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import time
+import pytest
+from fastapi import HTTPException
+from storage import LocalStorage
+import jobs
+import media
+from resize import resolve_source
+
+def test_release_retries_files_in_grace_period(tables, tmp_path, monkeypatch):
+    root = tmp_path / "uploads"
+    root.mkdir()
+    monkeypatch.setattr(media, "storage", LocalStorage(str(root)))
+    key = "d" * 64 + ".jpg"
+    (root / key).write_bytes(b"photo")
+    (root / ("d" * 64 + "_256.webp")).write_bytes(b"thumb")
+    url = f"/static/uploads/{key}"
+
+    queued = []
+    async def enqueue(db, name, payload=None, delay=0):
+        queued.append((name, payload, delay))
+    monkeypatch.setattr(jobs, "enqueue", enqueue)
+
+    # Just uploaded (maybe deduplicated onto): kept, and released again later
+    asyncio.run(media.release_media_job({"urls": [url]}))
+    assert (root / key).exists()
+    [(name, payload, delay)] = queued
+    assert name == "release_media" and payload == {"urls": [url]}
+    assert media.RELEASE_GRACE_SECONDS - 5 < delay <= media.RELEASE_GRACE_SECONDS + 1
+
+    old = time.time() - media.RELEASE_GRACE_SECONDS - 1
+    os.utime(root / key, (old, old))
+    queued.clear()
+    asyncio.run(media.release_media_job(payload))
+    assert os.listdir(root) == []
+    assert queued == []
+
+def test_media_hides_dot_paths_at_any_depth(client, auth):
+    root = media.settings.UPLOAD_DIR
+    os.makedirs(os.path.join(root, ".sessions"), exist_ok=True)
+    with open(os.path.join(root, ".sessions", "abc.part"), "wb") as f:
+        f.write(b"someone else's upload")
+    with open(os.path.join(root, "e" * 64 + ".jpg"), "wb") as f:
+        f.write(b"photo")
+
+    assert client.get(f"/media/uploads/{'e' * 64}.jpg", headers=auth).status_code == 200
+    for path in ("/media/uploads/.sessions/abc.part", "/media/uploads/.sessions/../.sessions/abc.part",
+                 "/media/uploads/%2Esessions/abc.part"):
+        assert client.get(path, headers=auth).status_code == 404, path
+    with pytest.raises(HTTPException):
+        resolve_source("uploads/.sessions/abc.part")
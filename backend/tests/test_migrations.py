@@ -0,0 +1,20 @@
+from sqlalchemy import inspect, text
+from database import engine
+import migrations
+
+def test_migrate_adds_missing_columns_once(tables):
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE upload_sessions DROP COLUMN photo_id"))
+
+    assert migrations.migrate(engine) == ["upload_sessions.photo_id"]
+    assert "photo_id" in {col["name"] for col in inspect(engine).get_columns("upload_sessions")}
+    # Later workers (and restarts) find nothing to do
+    assert migrations.migrate(engine) == []
+
+def test_migrate_drops_obsolete_indexes(tables):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX ix_album_comments_album_id ON album_comments (album_id)"))
+
+    assert migrations.migrate(engine) == ["dropped album_comments.ix_album_comments_album_id"]
+    names = {ix["name"] for ix in inspect(engine).get_indexes("album_comments")}
+    assert "ix_album_comments_album_id" not in names and "ix_album_comments_album_created_id" in names
@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+import pytest
+import fastjson
+from models import Album, AlbumPhoto, AlbumComment, MemoryDay, MemoryDayPhoto, LoveList
+
+# N+1 guard: a list endpoint must send the same number of statements whether it
+# returns one row or many. The budgets below are what the endpoints need today
+# (dependency + page query + one IN query per eager-loaded relationship); a
+# lazy load sneaking into serialization makes the big page cost more and fails.
+
+def add_albums(db, count):
+    for i in range(count):
+        album = Album(description=f"album {i}", date=date(2024, 1, 1) + timedelta(days=i))
+        album.photos = [AlbumPhoto(url=f"/static/uploads/{i:02d}{n}.jpg", variants=[]) for n in range(3)]
+        album.comments = [AlbumComment(content="nice", username="bob") for _ in range(2)]
+        db.add(album)
+    db.commit()
+
+def add_memory_days(db, count):
+    for i in range(count):
+        day = MemoryDay(title=f"day {i}", date=date(2024, 1, 1) + timedelta(days=i))
+        day.photos = [MemoryDayPhoto(url=f"/static/uploads/m{i:02d}{n}.jpg") for n in range(3)]
+        db.add(day)
+    db.commit()
+
+def add_lovelist(db, count):
+    db.add_all([LoveList(title=f"wish {i}", image_url=f"/static/uploads/l{i:02d}.jpg") for i in range(count)])
+    db.commit()
+
+# path, seed, statement budget
+ENDPOINTS = {
+    "album": ("/api/album/", add_albums, 4),
+    "album summary": ("/api/album/summary", add_albums, 3),
+    "memoryday": ("/api/memoryday/", add_memory_days, 3),
+    "lovelist": ("/api/lovelist/", add_lovelist, 2),
+}
+
+def statements_for(client, statements, path, expected_rows):
+    statements.reset()
+    response = client.get(path)
+    assert response.status_code == 200
+    assert len(response.json()) == expected_rows
+    return statements.count
+
+@pytest.mark.parametrize("fast_json", [True, False], ids=["fastjson", "pydantic"])
+@pytest.mark.parametrize("name", ENDPOINTS)
+def test_list_statement_count_is_fixed(name, fast_json, client, db, statements, monkeypatch):
+    monkeypatch.setattr(fastjson.settings, "FAST_JSON", fast_json)
+    path, seed, budget = ENDPOINTS[name]
+
+    seed(db, 1)
+    one = statements_for(client, statements, path, 1)
+    seed(db, 20)
+    many = statements_for(client, statements, path, 21)
+
+    assert one == many == budget, statements.statements
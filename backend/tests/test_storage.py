@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import io
+import os
+import time
+import uuid
+from datetime import date
+import pytest
+from fastapi import HTTPException
+from storage import LocalStorage, S3Storage
+from models import Album, AlbumPhoto
+import media
+import uploads
+
+# Every test runs against each backend:
+#   local     LocalStorage on tmp_path
+#   s3-moto   S3Storage against moto's in-process S3
+#   s3-minio  S3Storage against a real MinIO, when TEST_S3_ENDPOINT_URL is set:
+#             docker compose --profile s3 up -d minio minio-init
+#             TEST_S3_ENDPOINT_URL=http://localhost:9000 python -m pytest tests/test_storage.py
+
+MB = 1024 * 1024
+BUCKET = "qlxz-test"
+
+@pytest.fixture(params=["local", "s3-moto", "s3-minio"])
+def store(request, tmp_path):
+    if request.param == "local":
+        root = tmp_path / "uploads"
+        root.mkdir()
+        yield LocalStorage(str(root))
+        return
+
+    pytest.importorskip("boto3")
+    if request.param == "s3-moto":
+        moto = pytest.importorskip("moto")
+        with moto.mock_aws():
+            s3 = S3Storage(BUCKET, prefix="uploads/", region="us-east-1", access_key="testing",
+                           secret_key="testing", multipart_mb=5, tmp_dir=str(tmp_path))
+            s3.client.create_bucket(Bucket=BUCKET)
+            yield s3
+        return
+
+    endpoint = os.environ.get("TEST_S3_ENDPOINT_URL")
+    if not endpoint:
+        pytest.skip("TEST_S3_ENDPOINT_URL not set")
+    s3 = S3Storage(
+        os.environ.get("TEST_S3_BUCKET", "qlxz-uploads"),
+        prefix=f"tests-{uuid.uuid4().hex[:8]}/",
+        endpoint_url=endpoint,
+        region="us-east-1",
+        access_key=os.environ.get("TEST_S3_ACCESS_KEY", "minioadmin"),
+        secret_key=os.environ.get("TEST_S3_SECRET_KEY", "minioadmin"),
+        multipart_mb=5,
+        tmp_dir=str(tmp_path),
+    )
+    try:
+        s3.client.head_bucket(Bucket=s3.bucket)
+    except Exception as e:
+        pytest.skip(f"No S3 stand-in at {endpoint}: {e}")
+    yield s3
+    s3.delete_many([item.key for item in s3.list()])
+
+def put_bytes(store, tmp_path, key, data):
+    src = tmp_path / f".src-{uuid.uuid4().hex}"
+    src.write_bytes(data)
+    store.put_file(str(src), key)
+    assert not src.exists() # put_file takes ownership
+
+def read(store, key, start=0, length=None):
+    return b"".join(store.get(key, start, length))
+
+def jpeg(size):
+    return b"\xff\xd8\xff\xe0" + os.urandom(size - 4)
+
+def test_put_get_and_ranges(store, tmp_path):
+    # Above S3_MULTIPART_MB (5 here), so boto3 uploads it in parts
+    data = os.urandom(6 * MB + 17)
+    put_bytes(store, tmp_path, "a.bin", data)
+
+    assert store.exists("a.bin")
+    assert store.stat("a.bin").size == len(data)
+    assert read(store, "a.bin") == data
+    assert read(store, "a.bin", 100, 10) == data[100:110]
+    assert read(store, "a.bin", len(data) - 5) == data[-5:]
+
+def test_missing_key(store):
+    assert store.stat("nope.jpg") is None
+    assert not store.exists("nope.jpg")
+    with pytest.raises(Exception):
+        store.fetch("nope.jpg")
+
+def test_fetch_and_release(store, tmp_path):
+    data = os.urandom(1000)
+    put_bytes(store, tmp_path, "f.jpg", data)
+    path = store.fetch("f.jpg")
+    try:
+        with open(path, "rb") as f:
+            assert f.read() == data
+    finally:
+        store.release(path)
+    assert store.exists("f.jpg")
+
+def test_multipart_complete_with_retried_part(store):
+    key = ".sessions/up.part"
+    token = store.create_multipart(key)
+    first, last = os.urandom(5 * MB), os.urandom(1234)
+    store.upload_part(key, token, 0, 0, _part(os.urandom(5 * MB)), 5 * MB)
+    # A retried chunk replaces its part
+    store.upload_part(key, token, 0, 0, _part(first), len(first))
+    store.upload_part(key, token, 1, len(first), _part(last), len(last))
+    store.complete_multipart(key, token)
+
+    assert read(store, key) == first + last
+    assert key not in {item.key for item in store.list()} # hidden from listings and the sweep
+
+def test_multipart_abort(store):
+    key = ".sessions/gone.part"
+    token = store.create_multipart(key)
+    store.upload_part(key, token, 0, 0, _part(os.urandom(100)), 100)
+    store.abort_multipart(key, token)
+
+    assert store.stat(key) is None
+    if isinstance(store, S3Storage):
+        assert not store.client.list_multipart_uploads(Bucket=store.bucket).get("Uploads")
+    # Aborting twice (retried DELETE, purge after abort) is fine
+    store.abort_multipart(key, token)
+
+def test_move(store, tmp_path):
+    data = os.urandom(2048)
+    put_bytes(store, tmp_path, "from.jpg", data)
+    store.move("from.jpg", "to.jpg")
+    assert store.stat("from.jpg") is None
+    assert read(store, "to.jpg") == data
+
+def test_delete_and_delete_many(store, tmp_path):
+    for key in ("x.jpg", "y.jpg", "z.jpg"):
+        put_bytes(store, tmp_path, key, b"data")
+    store.delete("x.jpg")
+    # Missing keys are not an error
+    store.delete_many(["y.jpg", "z.jpg", "never-stored.jpg"])
+    assert [item.key for item in store.list()] == []
+
+def test_list_skips_hidden_keys(store, tmp_path):
+    put_bytes(store, tmp_path, "one.jpg", b"1")
+    put_bytes(store, tmp_path, "two.webp", b"22")
+    token = store.create_multipart(".sessions/hidden.part")
+    store.upload_part(".sessions/hidden.part", token, 0, 0, _part(b"333"), 3)
+    store.complete_multipart(".sessions/hidden.part", token)
+
+    listed = {item.key: item.size for item in store.list()}
+    assert listed == {"one.jpg": 1, "two.webp": 2}
+
+def test_touch_refreshes_mtime(store, tmp_path):
+    put_bytes(store, tmp_path, "t.jpg", b"t")
+    before = store.stat("t.jpg").mtime
+    time.sleep(1.1) # S3 timestamps have one-second resolution
+    store.touch("t.jpg")
+    assert store.stat("t.jpg").mtime > before
+    assert read(store, "t.jpg") == b"t"
+
+def test_presigned_url(store, tmp_path):
+    put_bytes(store, tmp_path, "p.jpg", b"p")
+    url = store.presigned_url("p.jpg", 60)
+    if store.is_local:
+        assert url is None
+    else:
+        assert "p.jpg" in url and "X-Amz-Signature=" in url
+
+def _part(data):
+    return io.BytesIO(data)
+
+async def _stream(data, size=64 * 1024):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+def _write_chunks(upload_id, chunks):
+    token = uploads.start_resumable(upload_id)
+    offset = 0
+    for index, chunk in enumerate(chunks):
+        written = asyncio.run(uploads.write_chunk(upload_id, token, index, offset, _stream(chunk), len(chunk)))
+        assert written == len(chunk)
+        offset += written
+    return token
+
+def _resumable_upload(upload_id, chunks):
+    return uploads.finish_resumable(upload_id, _write_chunks(upload_id, chunks))
+
+def test_finish_resumable(store, monkeypatch):
+    monkeypatch.setattr(uploads, "storage", store)
+    chunks = [jpeg(5 * MB), os.urandom(4321)]
+    sha256 = hashlib.sha256(b"".join(chunks)).hexdigest()
+
+    stored = _resumable_upload("session1", chunks)
+
+    assert stored.key == f"{sha256}.jpg"
+    assert stored.url == f"/static/uploads/{sha256}.jpg"
+    assert stored.size == 5 * MB + 4321
+    assert stored.content_type == "image/jpeg"
+    assert read(store, stored.key) == b"".join(chunks)
+    assert store.stat(uploads.resumable_key("session1")) is None
+
+    # Same bytes again: deduplicated onto the stored file, staging cleaned up
+    again = _resumable_upload("session2", chunks)
+    assert again.key == stored.key
+    assert store.stat(uploads.resumable_key("session2")) is None
+    assert [item.key for item in store.list()] == [stored.key]
+
+def test_finish_resumable_rejects_unknown_type(store, monkeypatch):
+    monkeypatch.setattr(uploads, "storage", store)
+    token = _write_chunks("bad", [b"not a photo" * 100])
+    with pytest.raises(HTTPException) as error:
+        uploads.finish_resumable("bad", token)
+    assert error.value.status_code == 415
+    # What the abort endpoint and the expired-session purge do
+    uploads.discard_resumable("bad", token)
+    assert store.stat(uploads.resumable_key("bad")) is None
+
+def test_collect_orphans(store, db, tmp_path, monkeypatch):
+    monkeypatch.setattr(media, "storage", store)
+    live, orphan, lost = "b" * 64, "a" * 64, "c" * 64
+    keys = {
+        f"{live}.jpg": True,
+        f"{live}_256.webp": True, # variant of a referenced original
+        f"{live}_poster.jpg": True,
+        f"{orphan}.jpg": False,
+        f"{orphan}_256.webp": False, # goes with its original
+        f"{lost}_1024.webp": False, # original long gone
+    }
+    for key in keys:
+        put_bytes(store, tmp_path, key, b"x" * 10)
+
+    album = Album(description="trip", date=date(2024, 5, 1))
+    db.add(album)
+    db.flush()
+    db.add(AlbumPhoto(album_id=album.id, url=f"/static/uploads/{live}.jpg"))
+    db.commit()
+
+    # Negative grace: everything counts as old enough
+    report = []
+    stats = media.collect_orphans(dry_run=True, grace_hours=-1, report=lambda key, size: report.append(key))
+    assert stats["orphaned"] == 3 and stats["live"] == 3
+    assert all(store.exists(key) for key in keys) # dry run
+
+    stats = media.collect_orphans(grace_hours=-1)
+    assert stats["orphaned"] == 3
+    assert {item.key for item in store.list()} == {key for key, keep in keys.items() if keep}
+
+    # Fresh files are left alone
+    assert media.collect_orphans(grace_hours=1)["young"] == 3
@@ -0,0 +1,93 @@
+from datetime import date, datetime, timedelta
+import pytest
+from sqlalchemy import delete, update
+from models import Album, ChangeLog
+from changelog import ChangeCursor, MAX_MISSING
+
+def add_album(db, description, change_id=None):
+    album = Album(description=description, date=date(2024, 5, 1))
+    db.add(album)
+    db.commit()
+    if change_id is not None:
+        # Rewrite its change_log row to a chosen id, as if allocated earlier
+        db.execute(delete(ChangeLog).where(ChangeLog.entity_id == album.id))
+        db.add(ChangeLog(id=change_id, entity="album", entity_id=album.id, op="upsert"))
+        db.commit()
+    return album
+
+def sync(client, token=None):
+    response = client.get("/api/sync/", params={"since": token} if token else None)
+    assert response.status_code == 200
+    return response.json()
+
+def test_late_commit_is_delivered(client, db):
+    add_album(db, "first", change_id=1)
+    first = sync(client)
+    assert first["full"] and first["token"] == "1"
+
+    # Id 2 is still in flight when 3 commits
+    add_album(db, "third", change_id=3)
+    body = sync(client, first["token"])
+    assert [a["description"] for a in body["album"]] == ["third"]
+    cursor = ChangeCursor.parse(body["token"])
+    assert cursor.last_id == 3 and set(cursor.missing) == {2}
+
+    # ... and commits afterwards
+    add_album(db, "second", change_id=2)
+    body = sync(client, body["token"])
+    assert not body["full"]
+    assert [a["description"] for a in body["album"]] == ["second"]
+    assert body["token"] == "3"
+
+def test_missing_ids_expire():
+    cursor = ChangeCursor().advance([1, 3], 3, now=1000)
+    assert cursor.missing == {2: 1000}
+    # Never committed: a rollback
+    assert ChangeCursor.parse(str(cursor)).advance([], 3, now=1000 + 3600).missing == {}
+
+def test_pruned_token_gets_full_snapshot(client, db):
+    for i in range(1, 6):
+        add_album(db, f"album {i}", change_id=i)
+    token = sync(client)["token"]
+    assert not sync(client, "2")["full"]
+
+    # Pruned up to 4; the album's newest row (5) stays
+    db.execute(delete(ChangeLog).where(ChangeLog.id <= 4))
+    db.commit()
+    add_album(db, "album 6", change_id=6)
+    body = sync(client, "2")
+    assert body["full"] and len(body["album"]) == 6
+    assert not sync(client, token)["full"]
+
+def test_invalid_token(client, tables):
+    assert client.get("/api/sync/", params={"since": "abc"}).status_code == 400
+
+def test_pruned_ids_are_not_tracked_as_missing(client, db):
+    db.execute(ChangeLog.__table__.insert(), [
+        {"id": i, "entity": "album", "entity_id": i, "op": "upsert"} for i in range(1, 1201)
+    ])
+    db.commit()
+    db.execute(delete(ChangeLog).where(ChangeLog.id <= 1050))
+    db.commit()
+
+    body = sync(client)
+    assert body["full"] and body["token"] == "1200"
+
+    # Fresh gaps are tracked, as runs
+    db.execute(delete(ChangeLog).where(ChangeLog.id.between(1100, 1149)))
+    db.commit()
+    token = sync(client)["token"]
+    assert len(token) < 40
+    assert set(ChangeCursor.parse(token).missing) == set(range(1100, 1150))
+
+    # Below a row older than CHANGE_LOG_SETTLE_SECONDS nothing is in flight any more
+    db.execute(update(ChangeLog).where(ChangeLog.id == 1160).values(created_at=datetime.utcnow() - timedelta(hours=1)))
+    db.commit()
+    assert sync(client)["token"] == "1200"
+
+def test_missing_ids_are_capped():
+    cursor = ChangeCursor().advance([], 5000, now=1000)
+    assert len(cursor.missing) == MAX_MISSING and max(cursor.missing) == 5000
+    assert ChangeCursor.parse(str(cursor)) == cursor
+    with pytest.raises(ValueError):
+        ChangeCursor.parse("5000.1_1000000-1000")
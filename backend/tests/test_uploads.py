@@ -0,0 +1,63 @@
+import os
+from datetime import date
+from sqlalchemy import func, select
+from models import Album, AlbumPhoto
+import uploads
+
+def login(client, username):
+    client.post("/api/auth/register", json={"username": username, "password": "secret"})
+    response = client.post("/api/auth/login", data={"username": username, "password": "secret"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def start_upload(client, auth, db, data):
+    album = Album(description="trip", date=date(2024, 5, 1))
+    db.add(album)
+    db.commit()
+    response = client.post("/api/album/uploads", headers=auth,
+                           json={"album_id": album.id, "filename": "a.jpg", "size": len(data)})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+def test_resumable_upload_belongs_to_its_creator(client, auth, db):
+    data = b"\xff\xd8\xff\xe0" + os.urandom(1000)
+    upload_id = start_upload(client, auth, db, data)
+    other = login(client, "bob")
+
+    assert client.get(f"/api/album/uploads/{upload_id}", headers=other).status_code == 404
+    assert client.put(f"/api/album/uploads/{upload_id}/chunks/0", headers=other, content=data).status_code == 404
+    assert client.post(f"/api/album/uploads/{upload_id}/complete", headers=other).status_code == 404
+    assert client.delete(f"/api/album/uploads/{upload_id}", headers=other).status_code == 404
+
+    assert client.put(f"/api/album/uploads/{upload_id}/chunks/0", headers=auth, content=data).status_code == 200
+    assert client.post(f"/api/album/uploads/{upload_id}/complete", headers=auth).status_code == 200
+
+def test_complete_is_idempotent(client, auth, db):
+    data = b"\xff\xd8\xff\xe0" + os.urandom(1000)
+    upload_id = start_upload(client, auth, db, data)
+    client.put(f"/api/album/uploads/{upload_id}/chunks/0", headers=auth, content=data)
+
+    first = client.post(f"/api/album/uploads/{upload_id}/complete", headers=auth)
+    assert first.status_code == 200
+    # The response was lost and the client retries
+    again = client.post(f"/api/album/uploads/{upload_id}/complete", headers=auth)
+    assert again.status_code == 200
+    assert again.json() == first.json()
+    assert first.json()["url"].startswith("/media/uploads/")
+    assert db.scalar(select(func.count()).select_from(AlbumPhoto)) == 1
+
+    # Finished: no more chunks
+    assert client.put(f"/api/album/uploads/{upload_id}/chunks/0", headers=auth, content=data).status_code == 409
+    assert client.delete(f"/api/album/uploads/{upload_id}", headers=auth).status_code == 200
+
+def ftyp(brand):
+    return b"\x00\x00\x00\x20ftyp" + brand + b"\x00\x00\x02\x00"
+
+def test_sniff_content_type_knows_its_ftyp_brands():
+    assert uploads.sniff_content_type(ftyp(b"isom")) == "video/mp4"
+    assert uploads.sniff_content_type(ftyp(b"mp42")) == "video/mp4"
+    assert uploads.sniff_content_type(ftyp(b"M4V ")) == "video/mp4"
+    assert uploads.sniff_content_type(ftyp(b"qt  ")) == "video/quicktime"
+    assert uploads.sniff_content_type(ftyp(b"3gp5")) == "video/3gpp"
+    assert uploads.sniff_content_type(ftyp(b"heic")) == "image/heic"
+    for brand in (b"avif", b"avis", b"crx ", b"M4A "):
+        assert uploads.sniff_content_type(ftyp(brand)) is None, brand
@@ -0,0 +1,284 @@
+import hashlib
+import os
+import tempfile
+import uuid
+from dataclasses import dataclass
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import func, select, text
+from starlette.concurrency import run_in_threadpool
+from config import get_settings
+from database import session_scope
+from models import UploadSession
+from storage import storage
+import jobs
+
+settings = get_settings()
+
+# Shared upload pipeline for every router: the multipart file is streamed to a
+# temp file in chunks off the event loop, hashed as it goes, checked against
+# per-kind type/size limits mid-stream and then published to storage (an atomic
+# rename for local storage, an upload for S3; see storage.py). Files are content
+# addressed: the name (storage key) is the SHA-256 of the bytes, so identical
+# uploads (retries, the same photo in several places) share one file. Deletion
+# goes through media.release_media, which checks for remaining references.
+
+CHUNK_SIZE = 1024 * 1024
+UPLOAD_URL_PREFIX = "/static/uploads/"
+
+IMAGE = "image"
+VIDEO = "video"
+MEDIA = (IMAGE, VIDEO)
+
+MAX_BYTES = {
+    IMAGE: settings.MAX_IMAGE_UPLOAD_MB * 1024 * 1024,
+    VIDEO: settings.MAX_VIDEO_UPLOAD_MB * 1024 * 1024,
+}
+
+# Resumable uploads assemble under a hidden key (a multipart upload on S3)
+RESUMABLE_PREFIX = ".sessions/"
+RESUMABLE_CHUNK_SIZE = settings.RESUMABLE_CHUNK_MB * 1024 * 1024
+RESUMABLE_MAX_BYTES = settings.MAX_RESUMABLE_UPLOAD_MB * 1024 * 1024
+
+# Extension by sniffed type, so identical bytes always map to the same name
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/bmp": ".bmp",
+    "image/heic": ".heic",
+    "video/mp4": ".mp4",
+    "video/quicktime": ".mov",
+    "video/3gpp": ".3gp",
+    "video/webm": ".webm",
+}
+
+@dataclass
+class StoredUpload:
+    url: str
+    key: str
+    sha256: str
+    size: int
+    content_type: str
+
+def upload_key(url):
+    # Storage key behind an /static/uploads/ URL, None for anything else
+    if not url or not url.startswith(UPLOAD_URL_PREFIX):
+        return None
+    filename = os.path.basename(url)
+    if not filename or filename.startswith("."):
+        return None
+    return filename
+
+def upload_url(key):
+    return f"{UPLOAD_URL_PREFIX}{key}"
+
+# Rows keep /static/uploads/<key>; clients get /media/... URLs, which check the
+# login (routers/files.py). Legacy /img/ and /static/img/ files map to /media/img/.
+MEDIA_URL_PREFIX = "/media/uploads/"
+MEDIA_LEGACY_PREFIX = "/media/img/"
+LEGACY_URL_PREFIXES = ("/static/img/", "/img/")
+
+def public_url(url):
+    # Stored URL -> the URL handed to clients
+    if not url:
+        return url
+    if url.startswith(UPLOAD_URL_PREFIX):
+        return MEDIA_URL_PREFIX + url[len(UPLOAD_URL_PREFIX):]
+    for prefix in LEGACY_URL_PREFIXES:
+        if url.startswith(prefix):
+            return MEDIA_LEGACY_PREFIX + url[len(prefix):]
+    return url
+
+def stored_url(url):
+    # URL sent back by a client (album photos, config images) -> stored form
+    if not url:
+        return url
+    if url.startswith(MEDIA_URL_PREFIX):
+        return UPLOAD_URL_PREFIX + url[len(MEDIA_URL_PREFIX):]
+    if url.startswith(MEDIA_LEGACY_PREFIX):
+        return LEGACY_URL_PREFIXES[1] + url[len(MEDIA_LEGACY_PREFIX):]
+    return url
+
+# ISO base media major brands written by cameras, phones and encoders for MP4 video
+MP4_BRANDS = {
+    b"isom", b"iso2", b"iso3", b"iso4", b"iso5", b"iso6", b"mp41", b"mp42", b"avc1",
+    b"M4V ", b"M4VH", b"M4VP", b"MSNV", b"dash", b"mmp4", b"f4v ",
+}
+
+def sniff_content_type(head: bytes):
+    # Judge by magic bytes; mobile clients often send application/octet-stream
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith(b"BM"):
+        return "image/bmp"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"heic", b"heix", b"heim", b"heis", b"mif1", b"msf1"):
+            return "image/heic"
+        if brand == b"qt  ":
+            return "video/quicktime"
+        if brand.startswith(b"3g"):
+            return "video/3gpp"
+        if brand in MP4_BRANDS:
+            return "video/mp4"
+        # avif, avis, crx (raw photos), M4A audio...: not something we store
+        return None
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm"
+    return None
+
+def check_content(head: bytes, kinds):
+    content_type = sniff_content_type(head)
+    kind = content_type.split("/")[0] if content_type else None
+    if kind not in kinds:
+        raise HTTPException(status_code=415, detail="Unsupported file type")
+    return content_type, MAX_BYTES[kind]
+
+def _write_chunk(buffer, digest, chunk):
+    digest.update(chunk)
+    buffer.write(chunk)
+
+def _store(tmp_path, sha256, content_type):
+    key = f"{sha256}{EXTENSIONS[content_type]}"
+    if storage.exists(key):
+        # Already stored: drop the copy, refresh mtime so release_media's grace period covers us
+        os.remove(tmp_path)
+        storage.touch(key)
+    else:
+        storage.put_file(tmp_path, key, content_type)
+    return key
+
+def _publish(buffer, tmp_path, sha256, content_type):
+    buffer.flush()
+    os.fsync(buffer.fileno())
+    buffer.close()
+    return _store(tmp_path, sha256, content_type)
+
+def _discard(buffer, tmp_path):
+    buffer.close()
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+async def save_upload(file: UploadFile, kinds=(IMAGE,)) -> StoredUpload:
+    os.makedirs(storage.tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(storage.tmp_dir, f".{uuid.uuid4()}.part")
+
+    digest = hashlib.sha256()
+    size = 0
+    content_type = None
+    max_bytes = 0
+
+    buffer = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if content_type is None:
+                content_type, max_bytes = check_content(chunk, kinds)
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail="File too large")
+            await run_in_threadpool(_write_chunk, buffer, digest, chunk)
+
+        if content_type is None:
+            raise HTTPException(status_code=400, detail="Empty file")
+        sha256 = digest.hexdigest()
+        key = await run_in_threadpool(_publish, buffer, tmp_path, sha256, content_type)
+    except BaseException:
+        await run_in_threadpool(_discard, buffer, tmp_path)
+        raise
+
+    return StoredUpload(
+        url=upload_url(key),
+        key=key,
+        sha256=sha256,
+        size=size,
+        content_type=content_type,
+    )
+
+# Resumable uploads. Chunk n is part n of a storage multipart upload, so the
+# chunks of one session may arrive at different app servers; the storage token
+# (the S3 UploadId) is kept on the UploadSession row.
+
+def resumable_key(upload_id: str) -> str:
+    return f"{RESUMABLE_PREFIX}{upload_id}.part"
+
+def start_resumable(upload_id: str):
+    # Blocking: run in the threadpool. Returns the storage token
+    return storage.create_multipart(resumable_key(upload_id))
+
+def hash_stored(key: str):
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in storage.get(key):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+async def write_chunk(upload_id: str, token, index: int, offset: int, stream, max_bytes: int) -> int:
+    # Spooled (memory, then disk) so the part goes to storage with a known length
+    spool = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE, dir=storage.tmp_dir)
+    written = 0
+    try:
+        async for data in stream:
+            written += len(data)
+            if written > max_bytes:
+                raise HTTPException(status_code=413, detail="Chunk too large")
+            await run_in_threadpool(spool.write, data)
+        await run_in_threadpool(spool.seek, 0)
+        await run_in_threadpool(storage.upload_part, resumable_key(upload_id), token, index, offset, spool, written)
+    finally:
+        await run_in_threadpool(spool.close)
+    return written
+
+def finish_resumable(upload_id: str, token, kinds=MEDIA) -> StoredUpload:
+    # Blocking: run in the threadpool
+    part_key = resumable_key(upload_id)
+    storage.complete_multipart(part_key, token)
+    head = b"".join(storage.get(part_key, 0, 64))
+    content_type, _ = check_content(head, kinds)
+
+    sha256, size = hash_stored(part_key)
+    key = f"{sha256}{EXTENSIONS[content_type]}"
+    if storage.exists(key):
+        storage.delete(part_key)
+        storage.touch(key)
+    else:
+        storage.move(part_key, key)
+
+    return StoredUpload(
+        url=upload_url(key),
+        key=key,
+        sha256=sha256,
+        size=size,
+        content_type=content_type,
+    )
+
+def discard_resumable(upload_id: str, token):
+    storage.abort_multipart(resumable_key(upload_id), token)
+
+async def purge_expired_upload_sessions(db) -> int:
+    # Abandoned sessions: no chunk received within RESUMABLE_UPLOAD_TTL_HOURS.
+    # Completed ones only keep their row around for retried completes
+    cutoff = func.timestampadd(text("HOUR"), -settings.RESUMABLE_UPLOAD_TTL_HOURS, func.now())
+    expired = (await db.scalars(select(UploadSession).where(UploadSession.updated_at < cutoff))).all()
+    for upload in expired:
+        if upload.photo_id is None:
+            await run_in_threadpool(discard_resumable, upload.id, upload.storage_token)
+        await db.delete(upload)
+    if expired:
+        await db.commit()
+    return len(expired)
+
+@jobs.register("purge_upload_sessions", every=3600)
+async def purge_upload_sessions_job(payload):
+    async with session_scope() as db:
+        await purge_expired_upload_sessions(db)
@@ -0,0 +1,60 @@
+import json
+import os
+import shutil
+import subprocess
+from config import get_settings
+
+settings = get_settings()
+
+# Poster frame and duration for uploaded videos, via the ffmpeg/ffprobe binaries
+# installed on the host (apt install ffmpeg). Without them videos simply get no
+# poster. The poster sits next to the video as <stem>_poster.jpg, like the image
+# variants, so it shares the content-hash name and lifecycle.
+
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".3gp", ".webm"}
+PROBE_TIMEOUT = 30
+
+FFMPEG = settings.FFMPEG_PATH or shutil.which("ffmpeg")
+FFPROBE = settings.FFPROBE_PATH or shutil.which("ffprobe")
+
+def is_video(path):
+    return os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS
+
+def poster_path(path):
+    return os.path.splitext(path)[0] + "_poster.jpg"
+
+def probe_duration(path):
+    # Seconds, or None if ffprobe is missing or can't read the file
+    if not FFPROBE:
+        return None
+    try:
+        output = subprocess.run(
+            [FFPROBE, "-v", "error", "-show_entries", "format=duration", "-of", "json", path],
+            capture_output=True, check=True, timeout=PROBE_TIMEOUT,
+        ).stdout
+        return float(json.loads(output)["format"]["duration"])
+    except (subprocess.SubprocessError, OSError, KeyError, ValueError) as e:
+        print(f"Error probing video {path}: {e}")
+        return None
+
+def extract_poster(path, at_seconds):
+    # Writes the frame at at_seconds (rotation applied) and returns its path, or None
+    if not FFMPEG:
+        return None
+    dest = poster_path(path)
+    if os.path.exists(dest):
+        return dest
+    tmp_path = f"{dest}.{os.getpid()}.tmp.jpg"
+    try:
+        subprocess.run(
+            [FFMPEG, "-v", "error", "-y", "-ss", f"{at_seconds:.3f}", "-i", path,
+             "-frames:v", "1", "-q:v", "3", tmp_path],
+            capture_output=True, check=True, timeout=PROBE_TIMEOUT,
+        )
+        os.replace(tmp_path, dest)
+        return dest
+    except (subprocess.SubprocessError, OSError) as e:
+        print(f"Error extracting poster from {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None